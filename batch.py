@@ -0,0 +1,214 @@
+"""Headless batch mode for trim/loop/combine.
+
+A manifest is a JSON file listing jobs. Each job names an operation and
+carries the same input values the Tk tabs collect, keyed by layout label:
+
+    {
+      "workers": 4,
+      "overwrite": false,
+      "jobs": [
+        {"operation": "trim_audio", "Select File": "D:/rec/*.wav",
+         "Start Time": "00:00:10", "Duration": "01:00:00"},
+        {"operation": "loop_video", "Select File": "D:/clips",
+         "Duration": "11:59:59"}
+      ]
+    }
+
+A file field pointing at a directory or a glob pattern expands into one job
+per matching file; "Output File" is ignored for expanded jobs so outputs
+don't collide. A file field may also be a query of the library index (see
+library.py), e.g. {"audio_codec": "flac", "min_duration": 3600}. A "recipe" job chains trim/loop/combine steps; see recipe.py.
+
+Usage: python batch.py manifest.json [--workers N] [--overwrite]
+"""
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import queue
+import sys
+import time
+
+import impl
+import library
+import recipe
+from scheduler import FINISHED_STATES, JobScheduler, JobState
+from util import *
+
+
+OPERATIONS = {
+    "trim_audio": impl.trim_command,
+    "loop_video": impl.loop_command,
+    "combine_audio_video": impl.combine_command,
+    "split_audio": impl.split_command,
+    "recipe": recipe.compile_recipe,  # Steps fused into as few runs as possible
+}
+
+FILE_FIELDS = ("Select File", "Select Video File", "Select Audio File")
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    return manifest
+
+def expand_paths(path):
+    if isinstance(path, dict):
+        return library.LibraryIndex().find(**path)
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if os.path.isfile(os.path.join(path, name)))
+    if glob.has_magic(path):
+        return sorted(p for p in glob.glob(path) if os.path.isfile(p))
+    return [path]
+
+def expand_jobs(jobs):
+    """Expand directory/glob file fields into one job per file."""
+    expanded = []
+    for job in jobs:
+        if job.get("operation") not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {job.get('operation')}")
+        for field in FILE_FIELDS:
+            value = job.get(field)
+            if value and (isinstance(value, dict) or os.path.isdir(value) or
+                          glob.has_magic(value)):
+                for path in expand_paths(value):
+                    expanded_job = dict(job, **{field: path})
+                    expanded_job.pop("Output File", None)
+                    expanded.append(expanded_job)
+                break
+        else:
+            expanded.append(dict(job))
+    return expanded
+
+def build_command(job, overwrite=False):
+    """(JobSpec, memo key) for a manifest job."""
+    spec = impl.build_spec(OPERATIONS[job["operation"]], job)
+    # No one can answer ffmpeg's overwrite prompt in batch mode
+    command = [c for c in spec.command if c not in ("-y", "-n")]
+    command.insert(1, "-y" if overwrite else "-n")
+    stages = spec.stages
+    if stages:
+        stages = [[(command if c is spec.command else c, seconds)
+                   for c, seconds in stage] for stage in stages]
+    spec = spec._replace(command=command, stages=stages)
+    return spec, impl.output_cache_key(spec)
+
+def job_result(job, output_file=None, scheduled=None, error=None):
+    result = {"operation": job["operation"], "job": job,
+              "output": output_file, "media_seconds": 0, "returncode": None,
+              "state": JobState.FAILED.value, "wall_seconds": 0}
+    if scheduled is not None:
+        result.update({
+            "returncode": scheduled.returncode,
+            "state": scheduled.state.value,
+            "wall_seconds": ((scheduled.time_end or 0) -
+                             (scheduled.time_start or 0)),
+        })
+        if scheduled.state is JobState.DONE:
+            result["media_seconds"] = scheduled.total_duration
+        if scheduled.note:
+            result["note"] = scheduled.note
+    if error is not None:
+        result["error"] = error
+    return result
+
+def summarize(results, wall_seconds):
+    succeeded = [r for r in results if r["returncode"] == 0]
+    media_seconds = sum(r["media_seconds"] for r in succeeded)
+    return {
+        "jobs": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "wall_seconds": wall_seconds,
+        "media_seconds": media_seconds,
+        "files_per_hour": len(succeeded) * 3600 / wall_seconds if wall_seconds else 0,
+        "media_seconds_per_second": media_seconds / wall_seconds if wall_seconds else 0,
+    }
+
+def run_batch(manifest, workers=None, overwrite=None, on_result=None):
+    """Run every job in the manifest through a JobScheduler.
+
+    workers is the most jobs that run at once, and the most commands (e.g.
+    chunks) one job runs side by side; it defaults to the manifest's
+    "workers" or the machine's core count. Within it the scheduler runs as
+    many jobs as raise throughput, starting from half the cores. A job may
+    set "priority" (lower runs first). Returns (results, summary).
+    """
+    jobs = expand_jobs(manifest.get("jobs", []))
+    workers = workers or manifest.get("workers") or os.cpu_count() or 1
+    if overwrite is None:
+        overwrite = manifest.get("overwrite", False)
+
+    results = []
+    def report(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    time_start = time.time()
+    events = queue.Queue()
+    scheduler = JobScheduler(max_concurrent=workers, events=events)
+    # Building a command probes its inputs, so build them concurrently too
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_command, job, overwrite): job
+                   for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                spec, cache_key = future.result()
+            except Exception as e:
+                print(f"Error in run_batch: {e}")
+                report(job_result(job, error=str(e)))
+                continue
+            scheduler.submit(spec.command, priority=job.get("priority", 0),
+                             total_duration=spec.duration,
+                             owner=(job, spec.outputs or spec.output_file),
+                             note=spec.note,
+                             stages=spec.stages, temp_paths=spec.temp_paths,
+                             output_file=spec.output_file, cache_key=cache_key,
+                             probe_seconds=spec.probe_seconds,
+                             prepare=spec.prepare)
+
+    pending = len(jobs) - len(results)
+    while pending:
+        scheduled, item = events.get()
+        if item in FINISHED_STATES:
+            job, output_file = scheduled.owner
+            report(job_result(job, output_file, scheduled))
+            pending -= 1
+    return results, summarize(results, time.time() - time_start)
+
+def format_summary(summary):
+    return (f"{summary['succeeded']}/{summary['jobs']} jobs succeeded"
+            f" in {convert_seconds_to_hhmmss(summary['wall_seconds'])}, "
+            f"{summary['files_per_hour']:.1f} files/hour, "
+            f"{summary['media_seconds_per_second']:.2f} media-s/s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ffmpeg-win jobs headless.")
+    parser.add_argument("manifest", help="JSON manifest of jobs")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Most jobs run at once, and commands per job "
+                             "run side by side (default: CPU count)")
+    parser.add_argument("--overwrite", action="store_true", default=None,
+                        help="Overwrite existing outputs")
+    args = parser.parse_args(argv)
+    redirect_stdout("ffmpeg-win")
+
+    def report(result):
+        status = "ok" if result["returncode"] == 0 else "FAILED"
+        note = f" ({result['note']})" if result.get("note") else ""
+        print(f"[{status}] {result['operation']}: {result['output']}{note}")
+
+    results, summary = run_batch(load_manifest(args.manifest),
+                                 workers=args.workers,
+                                 overwrite=args.overwrite,
+                                 on_result=report)
+    print(format_summary(summary))
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
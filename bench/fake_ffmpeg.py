@@ -0,0 +1,126 @@
+"""Stand-in ffmpeg executable for benchmarks.
+
+Replay mode (default) accepts any ffmpeg command line. When
+FAKE_FFMPEG_TRANSCRIPT names a recorded transcript, its stdout/stderr lines
+are replayed with their original timing divided by FAKE_FFMPEG_RATE.
+Otherwise a synthetic run is generated: the output covers the last -t
+argument (or FAKE_FFMPEG_DURATION) at FAKE_FFMPEG_SPEED media seconds per
+wall second, with a -progress block every FAKE_FFMPEG_INTERVAL media
+seconds. The last argument is created as the output file and the exit code
+is FAKE_FFMPEG_EXIT.
+
+Record mode runs the real ffmpeg with -progress pipe:1 and writes a
+transcript, one JSON object per line ({"t": seconds, "fd": 1|2, "line": ...}):
+
+    python bench/fake_ffmpeg.py --record out.jsonl -- -i in.wav -t 60 out.wav
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def last_value(argv, flag):
+    values = [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == flag]
+    return values[-1] if values else None
+
+def parse_seconds(value):
+    if value is None:
+        return None
+    parts = [float(p) for p in value.split(":")]
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+def touch_output(argv):
+    output = argv[-1] if argv else ""
+    if output and not output.startswith(("pipe:", "-")) and len(argv) > 1:
+        with open(output, "wb") as f:
+            f.write(b"\0" * 1024)
+
+def write_line(fd, line):
+    stream = sys.stdout if fd == 1 else sys.stderr
+    stream.write(line + "\n")
+    stream.flush()
+
+def replay(transcript_path, rate):
+    time_start = time.perf_counter()
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        for entry in map(json.loads, f):
+            delay = entry["t"] / rate - (time.perf_counter() - time_start)
+            if delay > 0:
+                time.sleep(delay)
+            write_line(entry["fd"], entry["line"])
+
+def synthesize(argv):
+    duration = (parse_seconds(last_value(argv, "-t")) or
+                env_float("FAKE_FFMPEG_DURATION", 60))
+    speed = env_float("FAKE_FFMPEG_SPEED", 100)
+    interval = env_float("FAKE_FFMPEG_INTERVAL", 0.5)
+    progress = "-progress" in argv
+    write_line(2, "ffmpeg version fake Copyright (c) the FFmpeg developers")
+    time_start = time.perf_counter()
+    out_time = 0.0
+    while True:
+        out_time = min(out_time + interval, duration)
+        delay = out_time / speed - (time.perf_counter() - time_start)
+        if delay > 0:
+            time.sleep(delay)
+        end = out_time >= duration
+        if progress:
+            us = int(out_time * 1e6)
+            write_line(1, (
+                f"bitrate=1411.2kbits/s\ntotal_size={int(out_time * 176400)}\n"
+                f"out_time_us={us}\nout_time_ms={us}\n"
+                f"out_time={out_time:.6f}\nspeed={speed:.3g}x\n"
+                f"progress={'end' if end else 'continue'}"))
+        else:
+            write_line(2, f"size=N/A time={out_time:.2f} bitrate=N/A speed={speed:.3g}x")
+        if end:
+            break
+
+def record(transcript_path, argv):
+    command = ["ffmpeg", "-progress", "pipe:1", "-nostats"] + argv
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               stdin=subprocess.DEVNULL, text=True)
+    time_start = time.perf_counter()
+    lock = threading.Lock()
+    with open(transcript_path, "w", encoding="utf-8") as f:
+        def pump(stream, fd):
+            for line in stream:
+                entry = {"t": time.perf_counter() - time_start, "fd": fd,
+                         "line": line.rstrip("\n")}
+                with lock:
+                    f.write(json.dumps(entry) + "\n")
+        threads = [threading.Thread(target=pump, args=(process.stdout, 1)),
+                   threading.Thread(target=pump, args=(process.stderr, 2))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return process.wait()
+
+def main(argv):
+    if argv[:1] == ["--record"]:
+        separator = argv.index("--") if "--" in argv else 2
+        return record(argv[1], argv[separator + 1:])
+    transcript = os.environ.get("FAKE_FFMPEG_TRANSCRIPT")
+    if transcript:
+        replay(transcript, env_float("FAKE_FFMPEG_RATE", 1))
+    else:
+        synthesize(argv)
+    touch_output(argv)
+    return int(env_float("FAKE_FFMPEG_EXIT", 0))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
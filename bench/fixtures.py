@@ -0,0 +1,39 @@
+"""Synthetic benchmark media rendered locally from ffmpeg's lavfi sources."""
+import os
+import subprocess
+
+
+# name -> ffmpeg arguments between the inputs and the output path
+FIXTURES = {
+    "tone.wav": (["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"],
+                 ["-c:a", "pcm_s16le"]),
+    "tone.flac": (["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"],
+                  ["-c:a", "flac"]),
+    "tone.m4a": (["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"],
+                 ["-c:a", "aac", "-b:a", "128k"]),
+    "testsrc.mp4": (["-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30",
+                     "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"],
+                    ["-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+                     "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest"]),
+    "testsrc.mkv": (["-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30"],
+                    ["-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+                     "-pix_fmt", "yuv420p"]),
+}
+
+def generate_fixtures(directory, duration=60, names=None):
+    """Render the fixtures into directory, skipping ones already there.
+
+    Returns {name: path}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name in names or FIXTURES:
+        inputs, output_args = FIXTURES[name]
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(directory, f"{stem}-{duration}s{ext}")
+        if not os.path.exists(path):
+            command = ["ffmpeg", "-y", "-v", "error", *inputs,
+                       "-t", str(duration), *output_args, path]
+            subprocess.run(command, check=True, stdin=subprocess.DEVNULL)
+        paths[name] = path
+    return paths
@@ -0,0 +1,345 @@
+"""Benchmark the overhead ffmpeg-win adds around ffmpeg.
+
+Measures cold start of the headless and GUI entry points against
+STARTUP_BUDGET_MS, probe latency on synthetic fixtures (needs a real ffmpeg/ffprobe),
+spawn-to-first-progress and end-to-end jobs/hour against bench/fake_ffmpeg.py,
+and ProgressParser throughput. Results are written as JSON tagged with the
+current commit, so runs from different commits can be compared.
+
+Usage: python bench/run.py [--output results.json] [--only probe,parse,...]
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from fixtures import generate_fixtures
+from util import convert_seconds_to_hhmmss
+
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+FAKE_FFMPEG = os.path.join(BENCH_DIR, "fake_ffmpeg.py")
+BENCHMARKS = ("startup", "probe", "first_progress", "parse", "jobs_per_hour")
+
+# Snippets timed in a fresh interpreter; "baseline" is the interpreter alone
+STARTUP_SNIPPETS = {
+    "baseline": "pass",
+    "import_batch": "import batch",
+    "import_impl": "import impl",
+    "first_window": (
+        "import importlib.util\n"
+        "spec = importlib.util.spec_from_file_location("
+        "'main_tk', {main_tk!r})\n"
+        "main_tk = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(main_tk)\n"
+        "root = main_tk.build_window()\n"
+        "root.update()\n"
+        "root.destroy()\n"),
+}
+
+# Most a snippet's median may take beyond the baseline's; bench/run.py
+# exits with status 1 when one is over
+STARTUP_BUDGET_MS = {
+    "import_batch": 200,
+    "import_impl": 200,
+    "first_window": 600,
+}
+
+def stats_ms(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": samples[0] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def install_fake_ffmpeg(directory):
+    """Put an ffmpeg launcher for fake_ffmpeg.py in directory."""
+    path = os.path.join(directory, "ffmpeg")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_FFMPEG}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+@contextlib.contextmanager
+def fake_ffmpeg(directory, **settings):
+    """Resolve "ffmpeg" to the fake, configured by FAKE_FFMPEG_* settings."""
+    install_fake_ffmpeg(directory)
+    saved = dict(os.environ)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+    for key, value in settings.items():
+        os.environ[f"FAKE_FFMPEG_{key.upper()}"] = str(value)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+@contextlib.contextmanager
+def in_directory(directory):
+    """Run with directory as the CWD, which holds cache/ and logs/."""
+    saved = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(saved)
+
+def bench_startup(work_dir, runs):
+    """Wall time of fresh interpreters importing the entry points or
+    showing the first window, and files they leave behind."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+    results = {}
+    for name, snippet in STARTUP_SNIPPETS.items():
+        snippet = snippet.format(main_tk=os.path.join(ROOT_DIR, "main-tk.py"))
+        cwd = os.path.join(work_dir, f"startup-{name}")
+        os.makedirs(cwd, exist_ok=True)
+        samples = []
+        for _ in range(runs):
+            time_start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", snippet], cwd=cwd,
+                                     env=env, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, text=True)
+            samples.append(time.perf_counter() - time_start)
+            if process.returncode != 0:
+                break
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()
+            results[name] = {"skipped": error[-1] if error else "failed"}
+            continue
+        created = sorted(os.path.relpath(os.path.join(directory, f), cwd)
+                         for directory, _, files in os.walk(cwd) for f in files)
+        results[name] = dict(stats_ms(samples), files_created=created)
+    baseline = results.get("baseline", {}).get("median_ms")
+    for name, budget in STARTUP_BUDGET_MS.items():
+        if baseline is not None and "median_ms" in results.get(name, {}):
+            results[name]["budget_ms"] = budget
+            results[name]["over_budget"] = (
+                results[name]["median_ms"] - baseline > budget)
+    return results
+
+def over_budget(results):
+    """Names of startup snippets slower than their STARTUP_BUDGET_MS."""
+    return [name for name, result in results.get("startup", {}).items()
+            if result.get("over_budget")]
+
+def bench_probe(work_dir, fixture_dir, duration, runs):
+    """Uncached ffprobe, in-memory cache hits and SQLite cache hits."""
+    import cache
+    import probe
+
+    paths = generate_fixtures(fixture_dir, duration)
+    db_path = os.path.join(work_dir, "probe.sqlite3")
+    cache.probe_caches["ffprobe"] = cache.ProbeCache(db_path=db_path)
+    results = {}
+    for name, path in paths.items():
+        cold, memory, disk = [], [], []
+        for _ in range(runs):
+            time_start = time.perf_counter()
+            data = probe.ffprobe_json(path)
+            cold.append(time.perf_counter() - time_start)
+        probe.probe_media(path)
+        for _ in range(runs):
+            time_start = time.perf_counter()
+            probe.probe_media(path)
+            memory.append(time.perf_counter() - time_start)
+        for _ in range(runs):
+            fresh = cache.ProbeCache(db_path=db_path)
+            time_start = time.perf_counter()
+            probe.parse_ffprobe_json(fresh.get(path))
+            disk.append(time.perf_counter() - time_start)
+        results[name] = {"ffprobe": stats_ms(cold),
+                         "memory_hit": stats_ms(memory),
+                         "disk_hit": stats_ms(disk),
+                         "streams": len(data.get("streams", []))}
+    return results
+
+def bench_first_progress(work_dir, runs):
+    """Time from submit() to the first Progress of a job."""
+    from scheduler import JobScheduler
+
+    # Interpreter start of the fake itself, to read the numbers against
+    baseline = []
+    for _ in range(runs):
+        time_start = time.perf_counter()
+        subprocess.run([sys.executable, FAKE_FFMPEG], env=dict(
+            os.environ, FAKE_FFMPEG_DURATION="0.01"),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        baseline.append(time.perf_counter() - time_start)
+
+    samples = []
+    with fake_ffmpeg(work_dir, speed=1000, interval=0.5):
+        scheduler = JobScheduler(max_concurrent=1)
+        output_file = os.path.join(work_dir, "first_progress.wav")
+        for _ in range(runs):
+            first = threading.Event()
+            time_first = []
+
+            def on_progress(progress):
+                if not first.is_set():
+                    time_first.append(time.perf_counter())
+                    first.set()
+
+            time_start = time.perf_counter()
+            job = scheduler.submit(["ffmpeg", "-y", "-i", "in.wav", "-t", "5",
+                                    output_file], total_duration=5,
+                                   on_progress=on_progress)
+            scheduler.wait([job])
+            if time_first:
+                samples.append(time_first[0] - time_start)
+    return {"spawn_to_first_progress": stats_ms(samples),
+            "fake_ffmpeg_process": stats_ms(baseline)}
+
+def bench_parse(blocks):
+    """ProgressParser throughput over a synthetic -progress stream."""
+    from progress import ProgressParser
+
+    lines = []
+    for i in range(blocks):
+        us = i * 500000
+        lines += [f"frame={i * 15}", "fps=250.0", "bitrate=1411.2kbits/s",
+                  f"total_size={i * 88200}", f"out_time_us={us}",
+                  f"out_time_ms={us}", f"out_time=00:00:{i / 2:09.6f}",
+                  "dup_frames=0", "drop_frames=0", "speed=41.2x",
+                  "progress=continue\n"]
+    parser = ProgressParser()
+    time_start = time.perf_counter()
+    updates = sum(1 for line in lines if parser.feed(line) is not None)
+    seconds = time.perf_counter() - time_start
+    return {"lines": len(lines), "updates": updates, "seconds": seconds,
+            "lines_per_second": len(lines) / seconds,
+            "updates_per_second": updates / seconds}
+
+def bench_jobs_per_hour(work_dir, jobs, workers, media_seconds, speed):
+    """run_batch over trim jobs against the fake ffmpeg, each running it."""
+    import batch
+    import memo
+
+    memo.MEMO_ENABLED = False  # The inputs are identical; time ffmpeg runs
+
+    input_dir = os.path.join(work_dir, "inputs")
+    os.makedirs(input_dir, exist_ok=True)
+    manifest = {"jobs": []}
+    for i in range(jobs):
+        input_file = os.path.join(input_dir, f"input{i:04}.wav")
+        open(input_file, "wb").close()
+        manifest["jobs"].append({
+            "operation": "trim_audio", "Select File": input_file,
+            "Output File": f"output{i:04}",
+            "Start Time": "00:00:00",
+            "Duration": convert_seconds_to_hhmmss(media_seconds),
+            "Seek Mode": "Accurate (Decode)"})
+    with fake_ffmpeg(work_dir, speed=speed, interval=0.5):
+        results, summary = batch.run_batch(manifest, workers=workers,
+                                           overwrite=True)
+    summary["workers"] = workers
+    summary["fake_speed"] = speed
+    return summary
+
+def run(args):
+    only = set(args.only.split(",")) if args.only else set(BENCHMARKS)
+    results = {}
+    fixtures = args.fixtures and os.path.abspath(args.fixtures)
+    # cache/ and logs/ of the code under test go in the work dir as well
+    with tempfile.TemporaryDirectory(prefix="ffmpeg-win-bench-") as work_dir, \
+            in_directory(work_dir):
+        fixture_dir = fixtures or os.path.join(work_dir, "fixtures")
+        if "startup" in only:
+            results["startup"] = bench_startup(work_dir, args.runs)
+        if "parse" in only:
+            results["parse"] = bench_parse(args.blocks)
+        if "probe" in only:
+            try:
+                results["probe"] = bench_probe(work_dir, fixture_dir,
+                                               args.duration, args.runs)
+            except (OSError, subprocess.CalledProcessError) as e:
+                results["probe"] = {"skipped": f"needs ffmpeg/ffprobe: {e}"}
+        if os.name == "nt" and only & {"first_progress", "jobs_per_hour"}:
+            # CreateProcess only resolves "ffmpeg" to an .exe
+            results["skipped"] = "fake ffmpeg benchmarks need a POSIX shell"
+            only -= {"first_progress", "jobs_per_hour"}
+        if "first_progress" in only:
+            results["first_progress"] = bench_first_progress(work_dir,
+                                                             args.runs)
+        if "jobs_per_hour" in only:
+            results["jobs_per_hour"] = bench_jobs_per_hour(
+                work_dir, args.jobs, args.workers, args.media_seconds,
+                args.speed)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ffmpeg-win overhead.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="JSON results file (default: bench/results/)")
+    parser.add_argument("--only", default=None,
+                        help=f"Comma separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--fixtures", default=None,
+                        help="Keep generated fixtures in this directory")
+    parser.add_argument("--duration", type=int, default=60,
+                        help="Fixture length in seconds")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="Repetitions of each latency measurement")
+    parser.add_argument("--blocks", type=int, default=100000,
+                        help="Progress blocks fed to the parser")
+    parser.add_argument("--jobs", type=int, default=50,
+                        help="Jobs in the jobs/hour batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent jobs in the jobs/hour batch")
+    parser.add_argument("--media-seconds", type=int, default=60,
+                        help="Media length of each batch job")
+    parser.add_argument("--speed", type=float, default=200,
+                        help="Fake ffmpeg speed (media seconds per second)")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    # Keep what the code under test prints out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+    report = {
+        "commit": commit,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{(commit or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+    slow = over_budget(results)
+    if slow:
+        print(f"Over the startup budget: {', '.join(slow)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
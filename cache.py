@@ -0,0 +1,154 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+CACHE_DIR = "cache"
+PROBE_CACHE_DB = "probe.sqlite3"
+
+class ProbeCache:
+    """Probe results keyed on (absolute path, size, mtime).
+
+    An in-memory LRU sits in front of an SQLite table, so a hit on an
+    unchanged file costs one os.stat(). Both layers are size-bounded and
+    evict least recently used entries.
+    """
+    def __init__(self, table="ffprobe", db_path=None, memory_entries=256,
+                 max_entries=20000):
+        self.table = table
+        self.db_path = db_path or os.path.join(CACHE_DIR, PROBE_CACHE_DB)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, timeout=30,
+                                      check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                " accessed REAL, data TEXT)")
+            self.db.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_accessed"
+                f" ON {self.table}(accessed)")
+        return self.db
+
+    @staticmethod
+    def key(file_path):
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path):
+        try:
+            key = self.key(file_path)
+        except OSError:
+            return None
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            row = self.connect().execute(
+                f"SELECT data FROM {self.table}"
+                " WHERE path=? AND size=? AND mtime_ns=?", key).fetchone()
+            if row is None:
+                return None
+            self.db.execute(f"UPDATE {self.table} SET accessed=? WHERE path=?",
+                            (time.time(), key[0]))
+            self.db.commit()
+            value = json.loads(row[0])
+            self.remember(key, value)
+            return value
+
+    def put(self, file_path, value):
+        try:
+            key = self.key(file_path)
+        except OSError:
+            return
+        with self.lock:
+            self.remember(key, value)
+            db = self.connect()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                key + (time.time(), json.dumps(value)))
+            count = db.execute(
+                f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_entries:
+                db.execute(
+                    f"DELETE FROM {self.table} WHERE path IN"
+                    f" (SELECT path FROM {self.table}"
+                    " ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+            db.commit()
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+def temp_path_for(path):
+    """A name next to path for writing it aside, unique per process and thread."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def atomic_write(path, write):
+    """Create or replace path with what write(f) writes to a binary file,
+    written aside and renamed so readers never see a partial file."""
+    temp_path = temp_path_for(path)
+    try:
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            ...
+        raise
+
+def file_entries(directory, suffix):
+    """(mtime, size, path) of the files in directory whose names end in suffix."""
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return entries
+    for name in names:
+        if name.endswith(suffix):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Evicted by another thread meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+def evict_entries(entries, max_bytes, remove=os.remove):
+    """Remove the least recently used of (last use, size, path) entries once
+    the more recent ones add up to max_bytes.
+
+    An entry that can't be removed yet, e.g. a file still memory-mapped on
+    Windows, is left for the next call.
+    """
+    total = 0
+    for _, size, path in sorted(entries, reverse=True):
+        total += size
+        if total > max_bytes:
+            try:
+                remove(path)
+            except OSError:
+                ...
+
+probe_caches = {}
+
+def get_probe_cache(table="ffprobe"):
+    """Shared cache per table; other per-file measurements use their own table."""
+    if table not in probe_caches:
+        probe_caches[table] = ProbeCache(table)
+    return probe_caches[table]
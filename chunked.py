@@ -0,0 +1,159 @@
+"""Segment-parallel re-encoding.
+
+The output timeline is split into one chunk per core, every chunk is
+encoded by its own ffmpeg process, and the chunks are joined by stream copy
+through the concat demuxer. Video chunks start on keyframes of the source;
+audio can be cut at any packet, so it is split evenly. Encoders with
+priming delay (e.g. AAC) may leave a few milliseconds of padding at chunk
+joins.
+"""
+import os
+
+from concat import work_dir_for, write_concat_list
+from keyframes import get_keyframe_index
+from util import format_seconds
+
+
+MIN_CHUNK_SECONDS = 60  # Shorter chunks cost more in process start than they save
+
+def chunk_count(duration, chunks=None):
+    chunks = chunks or os.cpu_count() or 1
+    return max(1, min(chunks, int(duration // MIN_CHUNK_SECONDS)))
+
+def chunk_bounds(duration, count, keyframe_before=None):
+    """Split [0, duration) into count chunks, evenly or starting on keyframes.
+
+    keyframe_before maps a time on the output timeline to the latest
+    keyframe at or before it.
+    """
+    starts = [0.0]
+    for i in range(1, count):
+        start = duration * i / count
+        if keyframe_before is not None:
+            start = keyframe_before(start)
+        if start > starts[-1]:
+            starts.append(start)
+    ends = starts[1:] + [duration]
+    return list(zip(starts, ends))
+
+def chunked_stages(chunk_commands, work_dir, join_command_for):
+    """Stages for a JobSpec: encode every chunk concurrently, then join."""
+    chunks_list = write_concat_list(
+        os.path.join(work_dir, "chunks.ffconcat"),
+        [path for path, _, _ in chunk_commands])
+    join = join_command_for(chunks_list)
+    total = sum(seconds for _, _, seconds in chunk_commands)
+    stages = [[(command, seconds) for _, command, seconds in chunk_commands],
+              [(join, total)]]
+    return join, stages
+
+def replace_chunks(job, chunk_commands, aligned):
+    """Put the aligned chunks' commands in place of chunk_commands' in job's
+    stages, which may hold other commands too (see recipe)."""
+    paths = {path for path, _, _ in chunk_commands}
+    stages = []
+    for stage in job.stages:
+        kept = [(command, seconds) for command, seconds in stage
+                if command[-1] not in paths]
+        if len(kept) < len(stage):
+            kept += [(command, seconds) for _, command, seconds in aligned]
+        stages.append(kept)
+    job.stages = stages
+
+def loop_chunks(file_path, source_duration, bounds, work_dir, ext):
+    chunk_commands = []
+    for i, (start, end) in enumerate(bounds):
+        path = os.path.join(work_dir, f"chunk{i:03}{ext}")
+        command = [
+            "ffmpeg", "-y",
+            "-stream_loop", "-1",
+            "-ss", format_seconds(start % source_duration),
+            "-i", file_path,
+            "-t", format_seconds(end - start),
+            path
+        ]
+        chunk_commands.append((path, command, end - start))
+    return chunk_commands
+
+def chunked_loop(file_path, source_duration, target_duration, output_file,
+                 chunks=None):
+    """(command, stages, temp_paths, prepare) re-encoding a loop in parallel
+    chunks.
+
+    Chunks start on keyframes of the source, which takes a scan of all its
+    packets; prepare, the job's prepare hook (see scheduler.Job), runs it
+    when the job starts and puts chunks split there in place of the evenly
+    split ones in stages.
+    """
+    work_dir = work_dir_for(output_file)
+    ext = os.path.splitext(output_file)[1]
+    count = chunk_count(target_duration, chunks)
+    chunk_commands = loop_chunks(file_path, source_duration,
+                                 chunk_bounds(target_duration, count),
+                                 work_dir, ext)
+
+    def join_command_for(chunks_list):
+        return [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", chunks_list,
+            "-map", "0",
+            "-c", "copy",
+            output_file
+        ]
+
+    command, stages = chunked_stages(chunk_commands, work_dir,
+                                     join_command_for)
+
+    def prepare(job, on_spawn):
+        index = get_keyframe_index(file_path, on_spawn=on_spawn)
+
+        def keyframe_before(t):
+            # Keyframes of the looped timeline repeat every source_duration
+            offset = t - t % source_duration
+            keyframe = index.before(t % source_duration)
+            return offset + (keyframe[0] if keyframe else 0.0)
+
+        aligned = loop_chunks(
+            file_path, source_duration,
+            chunk_bounds(target_duration, count, keyframe_before),
+            work_dir, ext)
+        write_concat_list(os.path.join(work_dir, "chunks.ffconcat"),
+                          [path for path, _, _ in aligned])
+        replace_chunks(job, chunk_commands, aligned)
+
+    return command, stages, [work_dir], prepare
+
+def chunked_combine(video_file, audio_file, audio_args, duration, output_file,
+                    chunks=None):
+    """(command, stages, temp_paths) re-encoding the audio in parallel chunks
+    and muxing it with the stream copied video."""
+    work_dir = work_dir_for(output_file)
+    chunk_commands = []
+    bounds = chunk_bounds(duration, chunk_count(duration, chunks))
+    for i, (start, end) in enumerate(bounds):
+        path = os.path.join(work_dir, f"chunk{i:03}.mka")
+        command = [
+            "ffmpeg", "-y",
+            "-ss", format_seconds(start),
+            "-i", audio_file,
+            "-t", format_seconds(end - start),
+            "-map", "0:a:0",
+            *audio_args,
+            path
+        ]
+        chunk_commands.append((path, command, end - start))
+
+    def join_command_for(chunks_list):
+        return [
+            "ffmpeg", "-n",
+            "-i", video_file,
+            "-f", "concat", "-safe", "0", "-i", chunks_list,
+            "-map", "0:v", "-map", "1:a",
+            "-c", "copy",
+            "-shortest",
+            output_file
+        ]
+
+    command, stages = chunked_stages(chunk_commands, work_dir,
+                                     join_command_for)
+    return command, stages, [work_dir]
@@ -0,0 +1,74 @@
+import os
+
+
+# Containers whose packets carry timestamps the concat demuxer can rebase,
+# matched against ffprobe's comma separated format_name.
+CONCAT_FORMATS = {"mov", "mp4", "matroska", "webm", "mpegts", "flac", "wav",
+                  "mp3", "ogg"}
+
+# Stream types that can't be concatenated by stream copy
+NON_CONCAT_STREAMS = {"attachment"}
+
+def concat_quote(path):
+    # Single-quoted per the ffconcat syntax, with ' escaped as '\''
+    return "'" + path.replace("'", "'\\''") + "'"
+
+def write_concat_list(list_path, entries):
+    """Write an ffconcat script.
+
+    Each entry is a path, or a dict with "file" and optional "inpoint",
+    "outpoint" and "options" (applied when the demuxer opens the file).
+    """
+    lines = ["ffconcat version 1.0"]
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"file": entry}
+        lines.append(f"file {concat_quote(entry['file'])}")
+        for key in ("inpoint", "outpoint"):
+            if entry.get(key) is not None:
+                lines.append(f"{key} {entry[key]}")
+        for key, value in entry.get("options", {}).items():
+            lines.append(f"option {key} {value}")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return list_path
+
+def can_concat_losslessly(media):
+    """Whether every stream of a probed file survives a concat stream copy."""
+    formats = set((media.format.format_name or "").split(","))
+    if not formats & CONCAT_FORMATS:
+        return False
+    if not media.streams or media.duration is None:
+        return False
+    return not any(s.codec_type in NON_CONCAT_STREAMS for s in media.streams)
+
+def work_dir_for(output_file):
+    """Intermediates of a multi-step job live next to its output, on the
+    same disk."""
+    directory, name = os.path.split(os.path.abspath(output_file))
+    work_dir = os.path.join(directory, f".{name}.parts")
+    os.makedirs(work_dir, exist_ok=True)
+    return work_dir
+
+def write_doubling_lists(source, loops, work_dir):
+    """Build an ffconcat script that plays source loops times.
+
+    Block k is a two-line script playing block k-1 twice, i.e. 2**k copies,
+    and the top-level script lists the blocks for the set bits of loops.
+    ffmpeg reads every block through the concat demuxer and stream copies,
+    so the scripts stay O(log loops) lines. The scripts are written to
+    work_dir, which belongs to the job reading them (see work_dir_for) and
+    goes with its temp_paths. Returns the top-level script.
+    """
+    source = os.path.abspath(source)
+    prefix = os.path.join(work_dir, f"loop{loops}")
+    nested = {"safe": "0"}  # Nested scripts open with default options
+    blocks = [write_concat_list(f"{prefix}-block0.ffconcat",
+                                [{"file": source}])]
+    while 2 ** len(blocks) <= loops:
+        previous = {"file": os.path.basename(blocks[-1]), "options": nested}
+        blocks.append(write_concat_list(
+            f"{prefix}-block{len(blocks)}.ffconcat", [previous, previous]))
+    entries = [{"file": os.path.basename(block), "options": nested}
+               for bit, block in enumerate(blocks) if loops & (1 << bit)]
+    return write_concat_list(f"{prefix}.ffconcat", entries)
@@ -0,0 +1,124 @@
+"""How many ffmpeg jobs run at once, and with how many threads each.
+
+The controller hill-climbs its job limit towards the most media seconds
+processed per second. Every interval it sums the speed= of the running
+jobs: while the last change of the limit raised that sum, the limit keeps
+moving the same way, and when it lowered it the limit turns around. The
+limit falls while the load average is above the core count, rises on its
+own only while cores sit idle and jobs are queued, and stays between 1 and
+max_jobs. Encoding jobs get the cores divided by the number of jobs
+expected to run alongside them as -threads. Stream copy jobs are I/O
+bound: at most io_per_disk of them run on any one disk.
+"""
+import os
+
+
+ADJUST_SECONDS = 10.0
+IO_JOBS_PER_DISK = 2
+TOLERANCE = 0.05  # Smaller changes in throughput are noise
+OVERLOAD = 1.5  # Load average per core above which the limit falls
+IDLE = 0.75  # Load average per core below which the limit may rise
+
+def system_load():
+    """1 minute load average, None where the OS has none (Windows)."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+def codec_values(command):
+    return [value for flag, value in zip(command, command[1:])
+            if flag in ("-c", "-codec", "-acodec", "-vcodec")
+            or flag.startswith(("-c:", "-codec:"))]
+
+def is_stream_copy(command):
+    codecs = codec_values(command)
+    return (bool(codecs) and all(value == "copy" for value in codecs) and
+            not any(flag in command for flag in ("-af", "-vf", "-filter_complex")))
+
+def with_threads(command, threads):
+    """command with -threads for the encoders of its (last) output."""
+    if not threads or "-threads" in command:
+        return command
+    return command[:-1] + ["-threads", str(threads), command[-1]]
+
+def disks(commands):
+    """Devices holding the inputs and outputs of commands."""
+    paths = []
+    for command in commands:
+        paths += [value for flag, value in zip(command, command[1:])
+                  if flag == "-i"]
+        paths.append(os.path.dirname(os.path.abspath(command[-1])))
+    devices = set()
+    for path in paths:
+        try:
+            devices.add(os.stat(path).st_dev)
+        except OSError:
+            ...  # Not a local file, e.g. a URL or lavfi graph
+    return devices
+
+class ConcurrencyController:
+    """Admission and -threads decisions of a JobScheduler (see module doc).
+
+    Called on the scheduler's event loop only.
+    """
+    def __init__(self, max_jobs, cores=None, io_per_disk=IO_JOBS_PER_DISK,
+                 interval=ADJUST_SECONDS):
+        self.cores = cores or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.limit = min(max_jobs, max(1, self.cores // 2))
+        self.io_per_disk = io_per_disk
+        self.interval = interval
+        self.running = 0
+        self.disk_jobs = {}  # Device -> stream copy jobs running on it
+        self.throughput = None
+        self.direction = 1
+
+    def has_slot(self):
+        return self.running < self.limit
+
+    def job_disks(self, job):
+        if job.disks is None:
+            commands = [command for stage in job.stages for command, _ in stage]
+            copy = all(is_stream_copy(command) for command in commands)
+            job.disks = disks(commands) if copy else set()
+        return job.disks
+
+    def can_start(self, job):
+        return all(self.disk_jobs.get(disk, 0) < self.io_per_disk
+                   for disk in self.job_disks(job))
+
+    def started(self, job, queued=0):
+        """Count job as running and set its threads; queued is how many
+        more jobs are waiting to start."""
+        self.running += 1
+        for disk in self.job_disks(job):
+            self.disk_jobs[disk] = self.disk_jobs.get(disk, 0) + 1
+        if job.threads is None and not job.disks:  # Stream copies don't encode
+            alongside = max(1, min(self.limit, self.running + queued))
+            job.threads = max(1, self.cores // alongside)
+
+    def finished(self, job):
+        self.running -= 1
+        for disk in self.job_disks(job):
+            self.disk_jobs[disk] -= 1
+
+    def adjust(self, throughput, queued, load=None):
+        """Move the limit one step given the running jobs' summed speed."""
+        previous, self.throughput = self.throughput, throughput
+        if load is not None and load > self.cores * OVERLOAD:
+            step = -1
+        elif previous is None or throughput > previous * (1 + TOLERANCE):
+            step = self.direction
+        elif throughput < previous * (1 - TOLERANCE):
+            step = -self.direction
+        elif load is not None and load < self.cores * IDLE:
+            step = 1
+        else:
+            step = 0
+        if step > 0 and not queued:
+            step = 0  # More slots would stay empty
+        limit = min(max(self.limit + step, 1), self.max_jobs)
+        if limit != self.limit:
+            self.direction = step
+            self.limit = limit
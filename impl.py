@@ -1,83 +1,98 @@
+import collections
+import functools
+import json
 import math
 import os
-import subprocess
-import re
 import threading
-import queue
 import time
-import sys
+import queue
 
 from util import *
-from layout import AUDIO_CODECS, SAMPLING_RATES, BIT_RATES
-
-
-logger = get_logger("ffmpeg-win")
-sys.stdout = LoggerWriter(logger)
-
-TASK_COMPLETION_SIGNAL = "===TASK_COMPLETION_SIGNAL==="
-
-# Define constants for regular expressions
-REGEX_AUDIO_STREAM = (
-    r"Stream #\d+:\d+: Audio: (\w+)"  # Codec (e.g., pcm_f32le, flac)
-    r"(?: \([^)]+\))?"               # Optional additional info in parentheses
-    r", (\d+ Hz)"                    # Sampling rate (e.g., 192000 Hz)
-    r", (stereo|mono|5\.1)"          # Channels (e.g., stereo)
-    r"(?:, (\w+))?"                  # Optional bit depth or format (e.g., flt, s32)
-    r"(?:, (\d+ kb/s))?"             # Optional bitrate (e.g., 12288 kb/s)
-)
-
-REGEX_FILE_INFO = (
-    r"Duration: (\d+:\d+:\d+\.\d+), start: [\d.]+, bitrate: (\d+ kb/s)"
-)
-
-REGEX_PROGRESS = r"time=(\d+:\d+:\d+\.\d+) bitrate=(\d+\.\d+kbits/s) speed=(\d+\.\d+x)"
-
-def get_ffmpeg_audio_stream_info(filename):
-    try:
-        # Run the `ffmpeg` command to get file information
-        command = ["ffmpeg", "-i", filename]
-        process = subprocess.Popen(
-            command,stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        _, stderr = process.communicate()  # Capture stderr output for metadata
-
-        # Parse file info for duration and bitrate
-        file_info_match = re.search(REGEX_FILE_INFO, stderr)
-        duration = file_info_match.group(1) if file_info_match else "Unknown"
-        overall_bitrate = file_info_match.group(2) if file_info_match else "Unknown"
-        stream_info = {
-            "Duration": duration,
-            "Overall Bitrate": overall_bitrate,
-        }
-
-        # Search for the audio stream information using the constant regular expression
-        match = re.search(REGEX_AUDIO_STREAM, stderr)
-        if match:
-            codec = match.group(1)  # Extract codec (e.g., pcm_f32le)
-            sampling_rate = match.group(2)  # Extract sampling rate (e.g., 192000 Hz)
-            channels = match.group(3)  # Extract channels (e.g., stereo)
-            bit_depth = match.group(4)  # Extract bit depth (e.g., flt)
-            bitrate = match.group(5)  # Extract bitrate (e.g., 12288 kb/s)
-
-            # Return the parsed information
-            stream_info.update({
-                "Bitrate": bitrate,
-                "Codec": codec,
-                "Sampling Rate": sampling_rate,
-                "Channels": channels,
-                "Bit Depth": bit_depth,
-            })
-        else:
-            print("Audio stream information not found.")
-        return stream_info
-
-    except Exception as e:
-        print(f"Error while getting ffmpeg audio stream info: {e}")
+from probe import cached_probe, probe_media
+from scheduler import JobScheduler
+from options import (AUDIO_CODECS, SAMPLING_RATES, BIT_RATES, LOOP_MODES,
+                     SEEK_MODES, ENCODING_MODES, AUTO_TRIM_MODES,
+                     LOUDNESS_TARGETS)
+from chunked import chunked_combine, chunked_loop
+from keyframes import keyframe_before
+from loudness import (linear_target, loudnorm_filter, measure_loudness,
+                      pending_filter)
+from smartcut import pending_smart_trim, smart_loop, smart_trim
+from concat import (can_concat_losslessly, work_dir_for,
+                    write_doubling_lists)
+from split import (chapter_ranges, complete_ranges, describe_split,
+                   output_names, read_ranges, split_command as split_ranges)
+import memo
+
+
+def format_bitrate(bit_rate):
+    return f"{bit_rate // 1000} kb/s" if bit_rate else "Unknown"
+
+def describe_stream(stream):
+    if stream.codec_type == "audio":
+        details = [stream.codec_name, f"{stream.sample_rate} Hz",
+                   stream.channel_layout or f"{stream.channels} channels",
+                   stream.sample_fmt]
+    elif stream.codec_type == "video":
+        details = [stream.codec_name, stream.pix_fmt,
+                   f"{stream.width}x{stream.height}", stream.r_frame_rate]
+    else:
+        details = [stream.codec_name]
+    if stream.bit_rate:
+        details.append(format_bitrate(stream.bit_rate))
+    return ", ".join(str(d) for d in details if d)
+
+def get_ffmpeg_audio_stream_info(filename, media=None, on_spawn=None):
+    """Key/value summary of a file for the property viewer."""
+    if media is None:
+        media = probe_media(filename, on_spawn)
+    if media is None:
         return None
-
-def get_file_properties(file_path):
+    duration = media.duration
+    stream_info = {
+        "Duration": format_timestamp(duration) if duration is not None else "Unknown",
+        "Overall Bitrate": format_bitrate(media.format.bit_rate),
+        "Format": media.format.format_long_name or media.format.format_name,
+    }
+    if media.audio_streams:
+        audio = media.audio_streams[0]
+        stream_info.update({
+            "Bitrate": format_bitrate(audio.bit_rate),
+            "Codec": audio.codec_name,
+            "Sampling Rate": f"{audio.sample_rate} Hz",
+            "Channels": audio.channel_layout or str(audio.channels),
+            "Bit Depth": (f"{audio.bits_per_raw_sample} ({audio.sample_fmt})"
+                          if audio.bits_per_raw_sample else audio.sample_fmt),
+        })
+    else:
+        print("Audio stream information not found.")
+    for stream in media.streams:
+        stream_info[f"Stream #{stream.index} ({stream.codec_type})"] = (
+            describe_stream(stream))
+    for chapter in media.chapters:
+        stream_info[f"Chapter {chapter.id}"] = (
+            f"{format_timestamp(chapter.start_time)} - "
+            f"{format_timestamp(chapter.end_time)} {chapter.title or ''}".strip())
+    return stream_info
+
+def media_duration(filename):
+    media = probe_media(filename)
+    if media is None or media.duration is None:
+        raise ValueError(f"Could not read duration of {filename}")
+    return media.duration
+
+def get_file_properties(file_path, cached_only=False, on_spawn=None):
+    """Property viewer rows for a file; with cached_only, None unless its
+    probe is already cached."""
     try:
+        media = None
+        if cached_only:
+            media = cached_probe(file_path)
+            if media is None:
+                return None
         # Gather file properties
-        file_properties = get_ffmpeg_audio_stream_info(file_path)
+        file_properties = get_ffmpeg_audio_stream_info(file_path, media,
+                                                       on_spawn)
         file_properties.update({
             "File Name": os.path.basename(file_path),
             "File Size": f"{os.path.getsize(file_path)} bytes",
@@ -88,164 +103,379 @@ def get_file_properties(file_path):
         print(f"Error in get_file_properties: {e}")
         return None
 
-import subprocess
-
-def run_ffmpeg_loop(input_file, output_file,
-                    loop_times, truncate_duration, output_queue):
-    print(run_ffmpeg_loop, input_file, output_file, loop_times, truncate_duration)
-    def target():
-      try:
-          # Build the FFmpeg command
-          command = [
-              "ffmpeg",
-              "-y",
-              "-stream_loop", str(loop_times),
-              "-i", input_file,
-              "-t", str(truncate_duration),
-              output_file
-          ]
-
-          print(command)
-          
-          # Run the command
-          process = subprocess.Popen(
-              command,
-              stdout=subprocess.PIPE, 
-              stderr=subprocess.PIPE, 
-              text=True
-          )
-          
-          # Capture output in real-time
-          for line in process.stderr:
-              # print(line.strip())  # Print to console (or parse to update UI)
-              output_queue.put(line.strip())
-              # yield line.strip()   # Yield output for progress bar parsing
-
-          process.wait()
-          output_queue.put(TASK_COMPLETION_SIGNAL)
-
-      except Exception as e:
-          print(f"Error while running FFmpeg: {e}")
-
-    threading.Thread(target=target).start()
+class PropertiesRequest:
+    """Loads a file's properties on a worker thread.
+
+    done is set once result holds the properties (None on failure).
+    cancel() kills the request's ffprobe if it is still running; a
+    cancelled request never sets done.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.result = None
+        self.done = threading.Event()
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="file-properties")
+        self.thread.start()
+
+    def attach(self, process):
+        with self.lock:
+            self.process = process
+            if self.cancelled:
+                process.kill()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+
+    def load(self):
+        return get_file_properties(self.file_path, on_spawn=self.attach)
+
+    def run(self):
+        result = self.load()
+        if not self.cancelled:
+            self.result = result
+            self.done.set()
+
+class WaveformRequest(PropertiesRequest):
+    """Loads a file's waveform.Peaks the same way."""
+    def load(self):
+        import waveform  # NumPy loads on first use, not at startup
+        return waveform.load_peaks(self.file_path, on_spawn=self.attach)
+
+# The scheduler posts (job, JobState | Progress) here for every job; the UI
+# drains it from its main loop.
+progress_events = queue.Queue()
+scheduler = None
+
+def get_scheduler():
+    global scheduler
+    if scheduler is None:
+        scheduler = JobScheduler(events=progress_events)
+    return scheduler
+
+def start_job(spec, active_page, priority=0):
+    return get_scheduler().submit(spec.command, priority=priority,
+                                  total_duration=spec.duration,
+                                  owner=active_page, note=spec.note,
+                                  stages=spec.stages,
+                                  temp_paths=spec.temp_paths,
+                                  output_file=spec.output_file,
+                                  cache_key=output_cache_key(spec),
+                                  describe=spec.describe,
+                                  probe_seconds=spec.probe_seconds,
+                                  prepare=spec.prepare)
+
+def output_cache_key(spec):
+    """memo key for a JobSpec, None if its inputs can't be fingerprinted."""
+    if spec.outputs:
+        return None  # memo keeps one output per job
+    if spec.stages:
+        commands = [command for stage in spec.stages for command, _ in stage]
+    else:
+        commands = [spec.command]
+    try:
+        return memo.job_key(commands, spec.output_file, spec.temp_paths or ())
+    except Exception as e:
+        print(f"Error in output_cache_key: {e}")
+        return None
+
+def output_path(input_path, output_name, suffix):
+    """Output goes next to the input, named output_name or <input><suffix>."""
+    dir, filename = os.path.split(input_path)
+    input_file, ext = os.path.splitext(filename)
+    if output_name:
+        return os.path.join(dir, f'{output_name}{ext}')
+    return os.path.join(dir, f'{input_file}{suffix}{ext}')
+
+# Command builders shared by the Tk callbacks and the headless batch runner.
+# Each takes the input_values dict keyed by layout labels and returns a
+# JobSpec; duration is the media length the output will cover and note is
+# anything the user should see next to the progress (e.g. a snapped start).
+# Multi-step jobs also carry stages and temp_paths (see scheduler.Job), with
+# command being the step that writes output_file. Jobs writing several files
+# list them in outputs (output_file is the first), and describe turns a
+# Progress into extra text for the progress line. build_spec() adds
+# probe_seconds, the time building the spec took. prepare is the job's
+# prepare hook (see scheduler.Job), for inputs measured when it starts.
+JobSpec = collections.namedtuple(
+    "JobSpec", ["command", "output_file", "duration", "note", "stages",
+                "temp_paths", "outputs", "describe", "probe_seconds",
+                "prepare"],
+    defaults=[None, None, None, None, None, None, None])
+
+def build_spec(builder, input_values):
+    time_start = time.time()
+    spec = builder(input_values)
+    return spec._replace(probe_seconds=time.time() - time_start)
+
+def trim_command(input_values):
+    file_path = input_values.get("Select File")
+    start_time = duration_to_seconds(input_values.get("Start Time"))
+    duration = duration_to_seconds(input_values.get("Duration"))
+    seek_mode = SEEK_MODES[input_values.get("Seek Mode") or "Fast (Keyframe)"]
+    threshold = AUTO_TRIM_MODES[input_values.get("Auto Trim") or "Off"]
+    output_file = output_path(file_path, input_values.get("Output File"),
+                              "_trimmed")
+    if threshold is not None:
+        return auto_trim_command(file_path, threshold, seek_mode, output_file)
+    print(f"Trimming audio: {file_path}, Start: {start_time}, Duration: {duration}")
+
+    if seek_mode == "smart":
+        command, stages, temp_paths = smart_trim(file_path, start_time,
+                                                 duration, output_file)
+        return JobSpec(command, output_file, duration, stages=stages,
+                       temp_paths=temp_paths)
+
+    if seek_mode == "output":
+        command = copy_trim_command(seek_mode, file_path,
+                                    format_seconds(start_time),
+                                    format_seconds(duration), output_file)
+        return JobSpec(command, output_file, duration)
+
+    # Seek the input to the keyframe at or before the start so the stream
+    # copy begins on a decodable packet; keep the requested end point.
+    end_time = start_time + duration
+    actual_start = keyframe_before(file_path, start_time)
+    note = None
+    if actual_start != start_time:
+        note = f"start snapped to keyframe at {format_timestamp(actual_start)}"
+        print(f"Trim start {start_time} {note}")
+    command = copy_trim_command(seek_mode, file_path,
+                                format_seconds(actual_start),
+                                format_seconds(end_time - actual_start),
+                                output_file)
+    return JobSpec(command, output_file, end_time - actual_start, note)
+
+def copy_trim_command(seek_mode, file_path, start_arg, duration_arg,
+                      output_file):
+    """Stream copy trim of the fast and accurate seek modes."""
+    if seek_mode == "output":
+        # Demux and discard everything up to the start point
+        return [
+            "ffmpeg",
+            "-i", file_path,
+            "-ss", start_arg,
+            "-t", duration_arg,
+            "-c", "copy",
+            output_file
+        ]
+    return [
+        "ffmpeg",
+        "-ss", start_arg,
+        "-i", file_path,
+        "-t", duration_arg,
+        "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        output_file
+    ]
+
+def pending_range(file_path, threshold):
+    """Placeholders for an auto trim's start and duration in its commands,
+    until its job detects them (see auto_trim)."""
+    key = json.dumps([file_path, threshold])
+    return f"autotrim-start={key}", f"autotrim-duration={key}"
+
+def auto_trim_command(file_path, threshold, seek_mode, output_file):
+    # Detecting the silence decodes the ends of the file, so it runs when
+    # the job starts; until then the range is pending
+    print(f"Trimming audio: {file_path}, Auto Trim: {threshold:g} dB")
+    start_arg, duration_arg = pending_range(file_path, threshold)
+    stages = temp_paths = render = None
+    if seek_mode == "smart":
+        command, stages, temp_paths, render = pending_smart_trim(
+            file_path, start_arg, duration_arg, output_file)
+    else:
+        command = copy_trim_command(seek_mode, file_path, start_arg,
+                                    duration_arg, output_file)
+    prepare = functools.partial(auto_trim, file_path, threshold, seek_mode,
+                                render)
+    return JobSpec(command, output_file, None, stages=stages,
+                   temp_paths=temp_paths, prepare=prepare)
+
+def auto_trim(file_path, threshold, seek_mode, render, job, on_spawn):
+    """Job prepare hook: detect the silence at the ends of file_path and
+    put the range between it in place of job's pending range."""
+    from silence import detect_silence  # NumPy loads on first use
+    silence = detect_silence(file_path, threshold, on_spawn)
+    print(f"Silence in {file_path}: {silence.intervals}")
+    start, end = silence.start, silence.end
+    notes = [f"auto trim {format_timestamp(start)} - {format_timestamp(end)}"]
+    if seek_mode == "input":
+        actual_start = keyframe_before(file_path, start)
+        if actual_start != start:
+            snapped = f"start snapped to keyframe at {format_timestamp(actual_start)}"
+            print(f"Trim start {start} {snapped}")
+            notes.append(snapped)
+            start = actual_start
+    if render is not None:
+        job.stages = [render(start, end - start),
+                      [(command, end - start) for command, _ in job.stages[1]]]
+    start_arg, duration_arg = pending_range(file_path, threshold)
+    fill_pending(job, {start_arg: format_seconds(start),
+                       duration_arg: format_seconds(end - start)})
+    job.total_duration = end - start
+    job.note = ", ".join(filter(None, [job.note, *notes]))
+
+def fill_pending(job, values):
+    """Put values[arg] in place of each pending arg in job's commands."""
+    def fill(command):
+        return [values.get(arg, arg) for arg in command]
+
+    job.command = fill(job.command)
+    job.stages = [[(fill(command), seconds) for command, seconds in stage]
+                  for stage in job.stages]
+
+def loop_command(input_values):
+    file_path = input_values.get("Select File")
+    duration = input_values.get("Duration")
+    output_file = output_path(file_path, input_values.get("Output File"),
+                              "_loop")
+
+    duration_src = media_duration(file_path)
+    duration_target = duration_to_seconds(duration)
+    loop_times = math.ceil(duration_target / duration_src)
+    loop_mode = LOOP_MODES[input_values.get("Loop Mode") or "Auto"]
+    print(f"Looping video: {file_path}, Duration: {duration}, Mode: {loop_mode}")
+
+    lossless = (os.path.splitext(output_file)[1].lower() ==
+                os.path.splitext(file_path)[1].lower() and
+                can_concat_losslessly(probe_media(file_path)))
+    if loop_mode == "smart":
+        command, stages, temp_paths = smart_loop(file_path, duration_src,
+                                                 duration_target, output_file)
+        return JobSpec(command, output_file, duration_target, stages=stages,
+                       temp_paths=temp_paths)
+    if loop_mode == "copy" and not lossless:
+        raise ValueError(f"{file_path} can't be looped by stream copy")
+    if loop_mode != "reencode" and lossless:
+        # Stream copy through doubling concat scripts, cut the tail with -t
+        work_dir = work_dir_for(output_file)
+        command = [
+            "ffmpeg",
+            "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", write_doubling_lists(file_path, loop_times, work_dir),
+            "-map", "0",
+            "-c", "copy",
+            "-t", str(duration_target),
+            output_file
+        ]
+        return JobSpec(command, output_file, duration_target,
+                       temp_paths=[work_dir])
+
+    if ENCODING_MODES[input_values.get("Encoding") or "Single Process"] == "chunked":
+        command, stages, temp_paths, prepare = chunked_loop(
+            file_path, duration_src, duration_target, output_file)
+        return JobSpec(command, output_file, duration_target, stages=stages,
+                       temp_paths=temp_paths, prepare=prepare)
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-stream_loop", str(loop_times),
+        "-i", file_path,
+        "-t", str(duration),
+        output_file
+    ]
+    return JobSpec(command, output_file, duration_target)
+
+def combine_command(input_values):
+    video_file = input_values.get("Select Video File")
+    audio_file = input_values.get("Select Audio File")
+    duration_video = media_duration(video_file)
+    duration_audio = media_duration(audio_file)
+    audio_codec = AUDIO_CODECS[input_values.get("Audio Codec")]
+    sampling_rate = SAMPLING_RATES[input_values.get("Sampling Rate")]
+    bit_rate = BIT_RATES[input_values.get("Bit Rate")]
+    output_file = output_path(video_file, input_values.get("Output File"),
+                              "_audio")
+    print((f"Combining video and audio: Video: {video_file}"
+          f", Audio: {audio_file}, Codec: {audio_codec}"
+          f", Sample Rate: {sampling_rate}, Bit Rate: {bit_rate}"))
+    duration = min(duration_video, duration_audio)
+    audio_args = ["-c:a", audio_codec, "-b:a", bit_rate, "-ar", sampling_rate]
+    prepare = None
+    target = LOUDNESS_TARGETS[input_values.get("Loudness") or "Off"]
+    if target is not None:
+        # A constant gain, so it applies to parallel chunks as well. The
+        # measurement decodes the whole file, so it runs when the job starts
+        audio_args = ["-af", pending_filter(audio_file, target), *audio_args]
+        prepare = functools.partial(normalize_loudness, audio_file, target)
+    if ENCODING_MODES[input_values.get("Encoding") or "Single Process"] == "chunked":
+        command, stages, temp_paths = chunked_combine(
+            video_file, audio_file, audio_args, duration, output_file)
+        return JobSpec(command, output_file, duration, stages=stages,
+                       temp_paths=temp_paths, prepare=prepare)
+
+    command = [
+        "ffmpeg",
+        "-i", video_file,
+        "-i", audio_file,
+        "-c:v", "copy",
+        *audio_args,
+        "-shortest",
+        output_file
+    ]
+    return JobSpec(command, output_file, duration, prepare=prepare)
+
+def normalize_loudness(audio_file, target, job, on_spawn):
+    """Job prepare hook: measure audio_file and put its loudnorm filter in
+    place of the pending one in job's commands."""
+    loudness = measure_loudness(audio_file, on_spawn)
+    fill_pending(job, {pending_filter(audio_file, target):
+                       loudnorm_filter(loudness, target)})
+    job.note = ", ".join(filter(None, [
+        job.note, f"loudness {loudness.integrated:.1f} -> "
+                  f"{linear_target(loudness, target)[0]:.1f} LUFS"]))
+
+def split_command(input_values):
+    file_path = input_values.get("Select File")
+    ranges_file = input_values.get("Ranges File")
+    media = probe_media(file_path)
+    if media is None:
+        raise ValueError(f"Could not probe {file_path}")
+    # A cue sheet or CSV if one is given, else the file's chapters
+    ranges = read_ranges(ranges_file) if ranges_file else chapter_ranges(media)
+    ranges = complete_ranges(ranges, media.duration)
+    if not ranges:
+        raise ValueError(f"No ranges to split {file_path} into")
+    outputs = output_names(file_path, ranges, input_values.get("Output File"))
+    start_time = media.format.start_time or 0.0
+    print(f"Splitting {file_path} into {len(ranges)} outputs")
+    command = split_ranges(file_path, ranges, outputs, start_time)
+    # Progress is the position in the input, up to the last range's end
+    return JobSpec(command, outputs[0], start_time + ranges[-1].end,
+                   f"{len(ranges)} outputs in one pass", outputs=outputs,
+                   describe=describe_split(ranges, start_time))
 
 def trim_audio(input_values, active_page):
     try:
-        # Example external program call
-        file_path = input_values.get("Select File")
-        file_properties = get_ffmpeg_audio_stream_info(file_path)
-        start_time = input_values.get("Start Time")
-        start_time = duration_to_seconds(start_time)
-        duration = input_values.get("Duration")
-        duration = duration_to_seconds(duration)
-        dir, filename = os.path.split(file_path)
-        input_file, ext = os.path.splitext(filename)
-        output_file = input_values.get("Output File")
-        if output_file:
-            output_file = os.path.join(dir, f'{output_file}{ext}')
-        else:
-            output_file = os.path.join(dir, f'{input_file}_trimmed{ext}')
-        print(f"Trimming audio: {file_path}, Start: {start_time}, Duration: {duration}")
+        spec = build_spec(trim_command, input_values)
     except Exception as e:
         print(f"Error in trim_audio: {e}")
+        return False
 
-    # Queue to handle output between threads
-    output_queue = queue.Queue()
-    def target():
-        try:
-            # Build the FFmpeg command
-            command = [
-                "ffmpeg",
-                "-i", file_path,
-                "-ss", str(start_time),
-                "-t", str(duration),
-                "-c", "copy",
-                output_file
-            ]
-
-            print(command)
-            
-            # Run the command
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            
-            # Capture output in real-time
-            for line in process.stderr:
-                # print(line.strip())  # Print to console (or parse to update UI)
-                output_queue.put(line.strip())
-                # yield line.strip()   # Yield output for progress bar parsing
-
-            process.wait()
-            output_queue.put(TASK_COMPLETION_SIGNAL)
-
-        except Exception as e:
-            print(f"Error while running FFmpeg: {e}")
-
-    threading.Thread(target=target).start()
-    update_progress_bar_with_timer(active_page,
-                                    output_queue, duration)
-    print(f"Trimming vaudio: {file_path}, Duration: {duration}")
-
-def parse_progress(ffmpeg_output):
-    # Match progress info like "frame=123 time=00:00:02.50 ..."
-    match = re.search(REGEX_PROGRESS, ffmpeg_output)
-    if match:
-        current_time = match.group(1)
-        bitrate = match.group(2)
-        speed = match.group(3)
-        print(f"Current processing time: {current_time}")
-        return(duration_to_seconds(current_time))
-    else:
-        print(ffmpeg_output)
-
-# Timer thread to update the progress bar
-def update_progress_bar_with_timer(active_page, output_queue, total_duration):
-    def update(time_start):
-        while not output_queue.empty():
-            now = time.time()
-            elapsed = now - time_start
-            line = output_queue.get()
-            current_time = parse_progress(line)
-            # Update the progress bar here (e.g., calculate percentage)
-            if current_time is not None:
-                percent = current_time / total_duration
-                if percent: ete = elapsed / percent
-                else: ete = 0
-                remaining = ete - elapsed
-                eta = now + remaining
-                print(line, f'elapsed: {elapsed}')
-                print('step', current_time, total_duration, percent)
-                active_page.find_progress_bar()['value'] = int(percent * 100)
-                active_page.set_entry("progress_text", (
-                    f'elapsed: {convert_seconds_to_hhmmss(elapsed)}, '
-                    f'remaining: {convert_seconds_to_hhmmss(remaining)}, '
-                    f'eta: {convert_epoch_to_hhmmss(eta)}'))
-            else:
-              if TASK_COMPLETION_SIGNAL in line:
-                print(TASK_COMPLETION_SIGNAL)
-                return True
-
-        # Schedule the next update
-        threading.Timer(0.1, update, args=(time_start,)).start()
-
-    update(time.time())
+    return start_job(spec, active_page)
+
+def split_audio(input_values, active_page):
+    try:
+        spec = build_spec(split_command, input_values)
+    except Exception as e:
+        print(f"Error in split_audio: {e}")
+        return False
+
+    return start_job(spec, active_page)
 
 def loop_video(input_values, active_page):
     try:
-        # Example external program call
-        file_path = input_values.get("Select File")
-        duration = input_values.get("Duration")
-        dir, filename = os.path.split(file_path)
-        input_file, ext = os.path.splitext(filename)
-        output_file = input_values.get("Output File")
-        if output_file:
-            output_file = os.path.join(dir, f'{output_file}{ext}')
-        else:
-            output_file = os.path.join(dir, f'{input_file}_loop{ext}')
+        output_file = output_path(input_values.get("Select File"),
+                                  input_values.get("Output File"), "_loop")
 
         # Check if output_file exist and ask for confirmation on overwriting.
         if os.path.isfile(output_file):
@@ -256,89 +486,16 @@ def loop_video(input_values, active_page):
                 print("User canceled the operation.")
                 return False
 
-        file_properties = get_ffmpeg_audio_stream_info(file_path)
-        print(file_properties['Duration'])
-        duration_src = duration_to_seconds(file_properties['Duration'])
-        duration_target = duration_to_seconds(duration)
-        loop_times = math.ceil(duration_target / duration_src)
-
-        # Queue to handle output between threads
-        output_queue = queue.Queue()
-
-        run_ffmpeg_loop(file_path, output_file,
-                        loop_times, duration, output_queue)
-        update_progress_bar_with_timer(active_page,
-                                       output_queue, duration_target)
-        print(f"Looping video: {file_path}, Duration: {duration}")
+        return start_job(build_spec(loop_command, input_values), active_page)
     except Exception as e:
         print(f"Error in loop_video: {e}")
 
 def combine_audio_video(input_values, active_page):
     try:
-        # Example external program call
-        video_file = input_values.get("Select Video File")
-        audio_file = input_values.get("Select Audio File")
-        file_properties = get_ffmpeg_audio_stream_info(video_file)
-        print(file_properties['Duration'])
-        duration_video = duration_to_seconds(file_properties['Duration'])
-        file_properties = get_ffmpeg_audio_stream_info(audio_file)
-        print(file_properties['Duration'])
-        duration_audio = duration_to_seconds(file_properties['Duration'])
-        audio_codec = AUDIO_CODECS[input_values.get("Audio Codec")]
-        sampling_rate = SAMPLING_RATES[input_values.get("Sampling Rate")]
-        bit_rate = BIT_RATES[input_values.get("Bit Rate")]
-        dir, filename = os.path.split(video_file)
-        input_file, ext = os.path.splitext(filename)
-        output_file = input_values.get("Output File")
-        if output_file:
-            output_file = os.path.join(dir, f'{output_file}{ext}')
-        else:
-            output_file = os.path.join(dir, f'{input_file}_audio{ext}')
-        print((f"Combining video and audio: Video: {video_file}"
-              f", Audio: {audio_file}, Codec: {audio_codec}"
-              f", Sample Rate: {sampling_rate}, Bit Rate: {bit_rate}"))
+        spec = build_spec(combine_command, input_values)
     except Exception as e:
         print(f"Error in combine_audio_video: {e}")
+        return False
+
+    return start_job(spec, active_page)
 
-    # Queue to handle output between threads
-    output_queue = queue.Queue()
-    def target():
-        try:
-            # Build the FFmpeg command
-            command = [
-                "ffmpeg",
-                "-i", video_file,
-                "-i", audio_file,
-                "-c:v", "copy",
-                "-c:a", audio_codec,
-                "-b:a", bit_rate,
-                "-ar", sampling_rate,
-                "-shortest",
-                output_file
-            ]
-
-            print(command)
-          
-            # Run the command
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            
-            # Capture output in real-time
-            for line in process.stderr:
-                # print(line.strip())  # Print to console (or parse to update UI)
-                output_queue.put(line.strip())
-                # yield line.strip()   # Yield output for progress bar parsing
-
-            process.wait()
-            output_queue.put(TASK_COMPLETION_SIGNAL)
-
-        except Exception as e:
-            print(f"Error while running FFmpeg: {e}")
-
-    threading.Thread(target=target).start()
-    update_progress_bar_with_timer(active_page,
-        output_queue, min(duration_video, duration_audio))
\ No newline at end of file
@@ -0,0 +1,269 @@
+import array
+import bisect
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import subprocess
+import threading
+
+from cache import (CACHE_DIR, ProbeCache, atomic_write, evict_entries,
+                   file_entries)
+from probe import probe_media
+
+
+SEEK_WINDOW = 30  # Seconds of packets to read back from a seek target
+
+INDEX_DIR = os.path.join(CACHE_DIR, "keyframes")
+INDEX_MAX_BYTES = 256 * 1024 * 1024
+# File layout: header, then count float64 times, then count int64 offsets
+INDEX_HEADER = struct.Struct("<4sII")  # magic, version, count
+INDEX_MAGIC = b"FWKI"
+INDEX_VERSION = 1
+
+def seek_stream(media):
+    """Cuts follow the first video stream's keyframes, else the first audio's."""
+    if media.video_streams:
+        return "v:0"
+    return "a:0"
+
+def read_keyframes(file_path, stream, start, end):
+    """Keyframe timestamps of one stream between start and end seconds."""
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", stream,
+        "-read_intervals", f"{start:.6f}%{end:.6f}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        file_path
+    ]
+    process = subprocess.run(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                             text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip())
+    keyframes = []
+    for line in process.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return keyframes
+
+def lookup(file_path):
+    """(media, stream, index) for keyframe lookups in a file.
+
+    stream is None for audio-only files, where every packet is a keyframe.
+    index is None until the file's keyframe index is built; it is then
+    built in the background for later lookups.
+    """
+    media = probe_media(file_path)
+    if media is None:
+        raise ValueError(f"Could not probe {file_path}")
+    if not media.video_streams:
+        return media, None, None
+    stream = seek_stream(media)
+    try:
+        index = cached_keyframe_index(file_path, stream)
+        if index is not None:
+            return media, stream, index
+    except Exception as e:
+        print(f"Error in keyframe index of {file_path}, scanning instead: {e}")
+    index_in_background(file_path, stream)
+    return media, stream, None
+
+def keyframe_before(file_path, seconds):
+    """Latest keyframe at or before seconds; seconds itself for audio-only
+    files.
+
+    Looks in the file's keyframe index if one was built already. Otherwise
+    reads packets in a window before seconds.
+    """
+    media, stream, index = lookup(file_path)
+    if stream is None:
+        return seconds
+    if index is not None:
+        keyframe = index.before(seconds)
+        return keyframe[0] if keyframe else 0.0
+    window = SEEK_WINDOW
+    while True:
+        start = max(0.0, seconds - window)
+        candidates = [t for t in read_keyframes(file_path, stream, start,
+                                                seconds + 0.001)
+                      if t <= seconds]
+        if candidates:
+            return max(candidates)
+        if start == 0:
+            return 0.0
+        window *= 2
+
+def keyframe_after(file_path, seconds):
+    """Earliest keyframe at or after seconds, None if there is none; seconds
+    itself for audio-only files. Looks up like keyframe_before, reading
+    packets in a window after seconds."""
+    media, stream, index = lookup(file_path)
+    if stream is None:
+        return seconds
+    if index is not None:
+        keyframe = index.after(seconds)
+        return keyframe[0] if keyframe else None
+    window = SEEK_WINDOW
+    while True:
+        end = seconds + window
+        candidates = [t for t in read_keyframes(file_path, stream, seconds, end)
+                      if t >= seconds]
+        if candidates:
+            return min(candidates)
+        if media.duration is None or end >= media.duration:
+            return None
+        window *= 2
+
+class KeyframeIndex:
+    """Keyframe timestamps and byte offsets of one stream, sorted by time.
+
+    Backed by a memory-mapped index file, so loading costs no parsing and
+    lookups are binary searches.
+    """
+    def __init__(self, times, offsets):
+        self.times = times
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.times)
+
+    def before(self, seconds):
+        """(time, offset) of the latest keyframe at or before seconds."""
+        i = bisect.bisect_right(self.times, seconds)
+        if i == 0:
+            return None
+        return self.times[i - 1], self.offsets[i - 1]
+
+    def after(self, seconds):
+        """(time, offset) of the first keyframe at or after seconds."""
+        i = bisect.bisect_left(self.times, seconds)
+        if i == len(self.times):
+            return None
+        return self.times[i], self.offsets[i]
+
+    def between(self, start, end):
+        """Keyframe times in [start, end)."""
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_left(self.times, end)
+        return [self.times[i] for i in range(lo, hi)]
+
+def index_path(file_path, stream):
+    path, size, mtime_ns = ProbeCache.key(file_path)
+    digest = hashlib.sha1(
+        f"{path}|{size}|{mtime_ns}|{stream}".encode("utf-8")).hexdigest()
+    return os.path.join(INDEX_DIR, f"{digest}.kfi")
+
+def scan_keyframes(file_path, stream, on_spawn=None):
+    """Stream ffprobe's packet list and collect keyframe times and offsets.
+
+    on_spawn gets the ffprobe Popen, e.g. to kill a scan no longer wanted.
+    """
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", stream,
+        "-show_entries", "packet=pts_time,pos,flags",
+        "-of", "csv=p=0",
+        file_path
+    ]
+    times = array.array("d")
+    offsets = array.array("q")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL,
+                               stdin=subprocess.DEVNULL, text=True)
+    if on_spawn is not None:
+        on_spawn(process)
+    for line in process.stdout:
+        pts_time, pos, flags = (line.strip().split(",") + ["", ""])[:3]
+        if "K" not in flags or pts_time in ("", "N/A"):
+            continue
+        times.append(float(pts_time))
+        offsets.append(int(pos) if pos.isdigit() else -1)
+    if process.wait() != 0:
+        raise RuntimeError(f"ffprobe failed to list packets of {file_path}")
+    # Packets come in decode order; keep lookups valid for B-frame streams
+    if any(times[i] > times[i + 1] for i in range(len(times) - 1)):
+        order = sorted(range(len(times)), key=times.__getitem__)
+        times = array.array("d", (times[i] for i in order))
+        offsets = array.array("q", (offsets[i] for i in order))
+    return times, offsets
+
+def write_index(path, times, offsets):
+    def write(f):
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(times)))
+        times.tofile(f)
+        offsets.tofile(f)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, write)
+
+@functools.lru_cache(maxsize=64)
+def load_index(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= INDEX_HEADER.size:
+            return KeyframeIndex([], [])
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, count = INDEX_HEADER.unpack_from(mapped)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        raise ValueError(f"Not a keyframe index: {path}")
+    view = memoryview(mapped)
+    start = INDEX_HEADER.size
+    times = view[start:start + 8 * count].cast("d")
+    offsets = view[start + 8 * count:start + 16 * count].cast("q")
+    return KeyframeIndex(times, offsets)
+
+def evict_indexes(max_bytes=INDEX_MAX_BYTES):
+    """Drop least recently used index files beyond max_bytes.
+
+    Lookups touch an index's mtime, so mtime order is recency order.
+    """
+    evict_entries(file_entries(INDEX_DIR, ".kfi"), max_bytes)
+
+def get_keyframe_index(file_path, stream=None, on_spawn=None):
+    """Keyframe index of a file, built once per (path, size, mtime)."""
+    if stream is None:
+        media = probe_media(file_path, on_spawn)
+        if media is None:
+            raise ValueError(f"Could not probe {file_path}")
+        stream = seek_stream(media)
+    path = index_path(file_path, stream)
+    if not os.path.exists(path):
+        print(f"Indexing keyframes of {file_path} ({stream})")
+        write_index(path, *scan_keyframes(file_path, stream, on_spawn))
+        evict_indexes()
+    else:
+        os.utime(path)
+    return load_index(path)
+
+def cached_keyframe_index(file_path, stream):
+    """Keyframe index of a file if it was built already, else None."""
+    path = index_path(file_path, stream)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return load_index(path)
+
+indexing = set()  # (path, stream) of indexes being built in the background
+indexing_lock = threading.Lock()
+
+def index_in_background(file_path, stream):
+    """Build a file's keyframe index on a worker thread, once at a time."""
+    key = (os.path.abspath(file_path), stream)
+    with indexing_lock:
+        if key in indexing:
+            return
+        indexing.add(key)
+
+    def run():
+        try:
+            get_keyframe_index(file_path, stream)
+        except Exception as e:
+            print(f"Error while indexing keyframes of {file_path}: {e}")
+        finally:
+            with indexing_lock:
+                indexing.discard(key)
+
+    threading.Thread(target=run, daemon=True, name="keyframe-index").start()
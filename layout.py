@@ -1,23 +1,12 @@
+import functools
+
 from pydantic import BaseModel
 from typing import List, Optional
 
+from options import (AUDIO_CODECS, SAMPLING_RATES, BIT_RATES, LOOP_MODES,
+                     SEEK_MODES, AUTO_TRIM_MODES, LOUDNESS_TARGETS,
+                     ENCODING_MODES)
 
-AUDIO_CODECS = {
-    "FLAC": "flac",
-    "AAC": "aac",
-}
-
-SAMPLING_RATES = {
-    "48 kHz": "48000",
-    "96 kHz": "96000",
-    "128 kHz": "128000",
-}
-
-BIT_RATES = {
-    "128k": "128k",
-    "256k": "256k",
-    "384k": "384k",
-}
 
 class Component(BaseModel):
     type: str  # Type of the component (e.g., "file_selection", "property_viewer", etc.)
@@ -33,55 +22,92 @@ class Tab(BaseModel):
 class Layout(BaseModel):
     tabs: List[Tab]  # List of all tabs
 
-layout = Layout(
-    tabs=[
-        Tab(
-            name="File Inspection",
-            callback="None",
-            rows=[
-                [Component(type="file_selection", label="Select File")],
-                [Component(type="property_viewer", label="File Properties")]
-            ]
-        ),
-        Tab(
-            name="Trim Audio",
-            callback="trim_audio",
-            rows=[
-                [Component(type="file_selection", label="Select File")],
-                [Component(type="text_input", label="Output File", default="")],
-                [Component(type="time_input", label="Start Time", default="00:00:00")],
-                [Component(type="time_input", label="Duration", default="11:59:59")],
-                [Component(type="button", label="Start")],
-                [Component(type="progress_bar", label="Trimming Progress")]
-            ]
-        ),
-        Tab(
-            name="Loop Video",
-            callback="loop_video",
-            rows=[
-                [Component(type="file_selection", label="Select File")],
-                [Component(type="text_input", label="Output File", default="")],
-                [Component(type="time_input", label="Duration", default="00:02:00")],
-                [Component(type="button", label="Start")],
-                [Component(type="progress_bar", label="Looping Progress")],
-            ]
-        ),
-        Tab(
-            name="Combine A&V",
-            callback="combine_audio_video",
-            rows=[
-                [Component(type="file_selection", label="Select Video File")],
-                [Component(type="file_selection", label="Select Audio File")],
-                [Component(type="text_input", label="Output File", default="")],
-                [Component(type="options", label="Audio Codec",
-                           options=AUDIO_CODECS.keys(), default="AAC")],
-                [Component(type="options", label="Sampling Rate", 
-                           options=SAMPLING_RATES.keys(), default="96 kHz")],
-                [Component(type="options", label="Bit Rate", 
-                           options=BIT_RATES.keys(), default="384k")],
-                [Component(type="button", label="Start")],
-                [Component(type="progress_bar", label="Combining Progress")]
-            ]
-        )
-    ]
-)
+def build_layout():
+    return Layout(
+        tabs=[
+            Tab(
+                name="File Inspection",
+                callback="None",
+                rows=[
+                    [Component(type="file_selection", label="Select File")],
+                    [Component(type="property_viewer", label="File Properties")],
+                    [Component(type="waveform", label="Waveform")]
+                ]
+            ),
+            Tab(
+                name="Trim Audio",
+                callback="trim_audio",
+                rows=[
+                    [Component(type="file_selection", label="Select File")],
+                    [Component(type="text_input", label="Output File", default="")],
+                    [Component(type="time_input", label="Start Time", default="00:00:00")],
+                    [Component(type="time_input", label="Duration", default="11:59:59")],
+                    [Component(type="options", label="Seek Mode",
+                               options=SEEK_MODES.keys(), default="Fast (Keyframe)")],
+                    [Component(type="options", label="Auto Trim",
+                               options=AUTO_TRIM_MODES.keys(), default="Off")],
+                    [Component(type="button", label="Start")],
+                    [Component(type="progress_bar", label="Trimming Progress")]
+                ]
+            ),
+            Tab(
+                name="Split Audio",
+                callback="split_audio",
+                rows=[
+                    [Component(type="file_selection", label="Select File")],
+                    # Cue sheet or CSV of ranges; empty splits at the chapters
+                    [Component(type="file_selection", label="Ranges File")],
+                    [Component(type="text_input", label="Output File", default="")],
+                    [Component(type="button", label="Start")],
+                    [Component(type="progress_bar", label="Splitting Progress")]
+                ]
+            ),
+            Tab(
+                name="Loop Video",
+                callback="loop_video",
+                rows=[
+                    [Component(type="file_selection", label="Select File")],
+                    [Component(type="text_input", label="Output File", default="")],
+                    [Component(type="time_input", label="Duration", default="00:02:00")],
+                    [Component(type="options", label="Loop Mode",
+                               options=LOOP_MODES.keys(), default="Auto")],
+                    [Component(type="options", label="Encoding",
+                               options=ENCODING_MODES.keys(), default="Single Process")],
+                    [Component(type="button", label="Start")],
+                    [Component(type="progress_bar", label="Looping Progress")],
+                ]
+            ),
+            Tab(
+                name="Combine A&V",
+                callback="combine_audio_video",
+                rows=[
+                    [Component(type="file_selection", label="Select Video File")],
+                    [Component(type="file_selection", label="Select Audio File")],
+                    [Component(type="text_input", label="Output File", default="")],
+                    [Component(type="options", label="Audio Codec",
+                               options=AUDIO_CODECS.keys(), default="AAC")],
+                    [Component(type="options", label="Sampling Rate", 
+                               options=SAMPLING_RATES.keys(), default="96 kHz")],
+                    [Component(type="options", label="Bit Rate", 
+                               options=BIT_RATES.keys(), default="384k")],
+                    [Component(type="options", label="Loudness",
+                               options=LOUDNESS_TARGETS.keys(), default="Off")],
+                    [Component(type="options", label="Encoding",
+                               options=ENCODING_MODES.keys(), default="Single Process")],
+                    [Component(type="button", label="Start")],
+                    [Component(type="progress_bar", label="Combining Progress")]
+                ]
+            )
+        ]
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_layout():
+    """The validated Layout, built on first use."""
+    return build_layout()
+
+def __getattr__(name):
+    # "from layout import layout" builds the layout on first use
+    if name == "layout":
+        return get_layout()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
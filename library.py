@@ -0,0 +1,214 @@
+"""Index of the media files under library directories.
+
+scan() walks a directory tree and probes new or changed files (by size and
+mtime) on a bounded thread pool, so a rescan only stats unchanged files.
+Each file's codecs, sample rate, duration and full ffprobe output go into
+an SQLite table indexed for find(), which picks e.g. batch inputs by codec,
+sample rate or duration. A failed probe is recorded too, and retried once
+the file changes.
+
+Usage:
+    python library.py scan D:/recordings [--workers 16]
+    python library.py find --audio-codec flac --min-duration 3600 [--under D:/rec]
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from cache import CACHE_DIR
+from probe import ffprobe_json, parse_ffprobe_json
+
+
+LIBRARY_DB = os.path.join(CACHE_DIR, "library.sqlite3")
+MEDIA_EXTENSIONS = {
+    ".wav", ".flac", ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".wma", ".aif",
+    ".aiff", ".mka", ".mp4", ".mov", ".mkv", ".webm", ".avi", ".ts", ".m4v",
+}
+COMMIT_EVERY = 500  # Probed files written per transaction
+
+COLUMNS = ["path", "size", "mtime_ns", "scanned", "duration", "format_name",
+           "audio_codec", "sample_rate", "channels", "video_codec", "width",
+           "height", "bit_rate", "error", "data"]
+
+def walk_media(root, extensions=MEDIA_EXTENSIONS):
+    """(path, size, mtime_ns) of media files under root, skipping hidden
+    directories such as the .parts work dirs of running jobs."""
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            directories.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in extensions:
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+        except OSError as e:
+            print(f"Error while scanning {directory}: {e}")
+
+def probe_row(path, size, mtime_ns):
+    """Index row of a file, with error set if it could not be probed."""
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=path, size=size, mtime_ns=mtime_ns, scanned=time.time())
+    try:
+        data = ffprobe_json(path)
+        media = parse_ffprobe_json(data)
+    except Exception as e:
+        row["error"] = str(e)
+        return row
+    row.update(duration=media.duration, format_name=media.format.format_name,
+               bit_rate=media.format.bit_rate, data=json.dumps(data))
+    if media.audio_streams:
+        audio = media.audio_streams[0]
+        row.update(audio_codec=audio.codec_name, sample_rate=audio.sample_rate,
+                   channels=audio.channels)
+    if media.video_streams:
+        video = media.video_streams[0]
+        row.update(video_codec=video.codec_name, width=video.width,
+                   height=video.height)
+    return row
+
+def prefix_range(directory):
+    # Paths under directory sort between these two keys
+    prefix = os.path.join(os.path.abspath(directory), "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+class LibraryIndex:
+    def __init__(self, db_path=LIBRARY_DB):
+        self.db_path = db_path
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                " scanned REAL, duration REAL, format_name TEXT,"
+                " audio_codec TEXT, sample_rate INTEGER, channels INTEGER,"
+                " video_codec TEXT, width INTEGER, height INTEGER,"
+                " bit_rate INTEGER, error TEXT, data TEXT)")
+            for name, columns in (("audio", "audio_codec, sample_rate"),
+                                  ("sample_rate", "sample_rate"),
+                                  ("duration", "duration"),
+                                  ("video", "video_codec")):
+                self.db.execute(f"CREATE INDEX IF NOT EXISTS files_{name}"
+                                f" ON files({columns})")
+        return self.db
+
+    def known_files(self, root):
+        """path -> (size, mtime_ns) of indexed files under root."""
+        rows = self.connect().execute(
+            "SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?",
+            prefix_range(root))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def write(self, rows):
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(COLUMNS))})",
+            [[row[c] for c in COLUMNS] for row in rows])
+        self.db.commit()
+
+    def scan(self, root, workers=None, on_progress=None):
+        """Bring the index of root up to date; returns counts of what was
+        done. on_progress gets (probed, to_probe) as probes finish."""
+        time_start = time.time()
+        root = os.path.abspath(root)
+        known = self.known_files(root)
+        changed = []
+        seen = 0
+        for path, size, mtime_ns in walk_media(root):
+            seen += 1
+            if known.pop(path, None) != (size, mtime_ns):
+                changed.append((path, size, mtime_ns))
+        # Whatever is left was deleted or moved away
+        self.db.executemany("DELETE FROM files WHERE path = ?",
+                            [(path,) for path in known])
+        self.db.commit()
+
+        workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        rows = []
+        failed = probed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(probe_row, *entry) for entry in changed]
+            for future in concurrent.futures.as_completed(futures):
+                row = future.result()
+                rows.append(row)
+                probed += 1
+                failed += row["error"] is not None
+                if len(rows) >= COMMIT_EVERY:
+                    self.write(rows)
+                    rows = []
+                if on_progress:
+                    on_progress(probed, len(changed))
+        if rows:
+            self.write(rows)
+        return {"files": seen, "probed": probed, "failed": failed,
+                "unchanged": seen - probed, "removed": len(known),
+                "seconds": time.time() - time_start}
+
+    def find(self, audio_codec=None, video_codec=None, sample_rate=None,
+             min_duration=None, max_duration=None, under=None):
+        """Paths of indexed files matching every given condition."""
+        conditions = ["error IS NULL"]
+        values = []
+        for column, value in (("audio_codec", audio_codec),
+                              ("video_codec", video_codec),
+                              ("sample_rate", sample_rate)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if min_duration is not None:
+            conditions.append("duration >= ?")
+            values.append(min_duration)
+        if max_duration is not None:
+            conditions.append("duration <= ?")
+            values.append(max_duration)
+        if under is not None:
+            conditions.append("path >= ? AND path < ?")
+            values += prefix_range(under)
+        rows = self.connect().execute(
+            f"SELECT path FROM files WHERE {' AND '.join(conditions)}"
+            " ORDER BY path", values)
+        return [path for path, in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and query media files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan = commands.add_parser("scan", help="Index new or changed files")
+    scan.add_argument("root", nargs="+", help="Directories to scan")
+    scan.add_argument("-w", "--workers", type=int, default=None,
+                      help="Concurrent ffprobe runs (default: 2 per core)")
+    find = commands.add_parser("find", help="Print paths of matching files")
+    find.add_argument("--audio-codec")
+    find.add_argument("--video-codec")
+    find.add_argument("--sample-rate", type=int)
+    find.add_argument("--min-duration", type=float, help="Seconds")
+    find.add_argument("--max-duration", type=float, help="Seconds")
+    find.add_argument("--under", help="Only files in this directory")
+    args = parser.parse_args(argv)
+
+    index = LibraryIndex()
+    if args.command == "scan":
+        for root in args.root:
+            counts = index.scan(root, workers=args.workers)
+            print(f"{root}: {counts['files']} files, {counts['probed']} probed "
+                  f"({counts['failed']} failed), {counts['removed']} removed "
+                  f"in {counts['seconds']:.1f}s")
+    else:
+        for path in index.find(args.audio_codec, args.video_codec,
+                               args.sample_rate, args.min_duration,
+                               args.max_duration, args.under):
+            print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
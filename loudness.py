@@ -0,0 +1,92 @@
+"""Two-pass EBU R128 loudness normalization.
+
+The first pass runs ffmpeg's loudnorm filter over a file's audio to
+measure its integrated loudness, true peak, loudness range and gating
+threshold. The measurement is cached per file in the probe cache's
+"loudness" table, so later renders of the same file skip that pass. The
+second pass is a loudnorm filter given the measurement in linear mode, a
+constant gain, added to the encode that already re-encodes the audio.
+Commands are built with a pending_filter() in its place, which the job
+fills in when it starts, so the measurement never runs on the UI thread.
+"""
+import collections
+import json
+import math
+import subprocess
+
+from cache import get_probe_cache
+
+
+Loudness = collections.namedtuple(
+    "Loudness", ["integrated", "true_peak", "lra", "threshold"])
+
+# Ranges loudnorm accepts for its targets
+MAX_LRA = 50.0
+MIN_INTEGRATED = -70.0
+
+def measure_command(audio_file):
+    return ["ffmpeg", "-hide_banner", "-nostats", "-nostdin",
+            "-i", audio_file, "-map", "0:a:0",
+            "-af", "loudnorm=print_format=json", "-f", "null", "-"]
+
+def parse_measurement(stderr):
+    # loudnorm prints its JSON summary last
+    start, end = stderr.rfind("{"), stderr.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("loudnorm printed no measurement")
+    values = json.loads(stderr[start:end + 1])
+    return Loudness(float(values["input_i"]), float(values["input_tp"]),
+                    float(values["input_lra"]), float(values["input_thresh"]))
+
+def measure_loudness(audio_file, on_spawn=None):
+    """Loudness of audio_file's first audio stream, measured once per file.
+
+    on_spawn gets the measuring ffmpeg's Popen, e.g. to kill it on cancel.
+    """
+    cache = get_probe_cache("loudness")
+    cached = cache.get(audio_file)
+    if cached is not None:
+        return Loudness(*cached)
+    print(f"Measuring loudness of {audio_file}")
+    process = subprocess.Popen(measure_command(audio_file),
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                               encoding="utf-8", errors="replace")
+    if on_spawn is not None:
+        on_spawn(process)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise ValueError(f"Could not measure loudness of {audio_file}: "
+                         f"{stderr.strip()[-500:]}")
+    loudness = parse_measurement(stderr)
+    if not all(math.isfinite(value) for value in loudness):
+        raise ValueError(f"{audio_file} is too quiet to normalize")
+    cache.put(audio_file, list(loudness))
+    return loudness
+
+def linear_target(loudness, target):
+    """(integrated, true peak, LRA) target that loudnorm reaches with a
+    constant gain: no louder than the true peak ceiling allows, and a range
+    no narrower than the measured one."""
+    integrated, true_peak, lra = target
+    integrated = min(integrated,
+                     loudness.integrated + true_peak - loudness.true_peak)
+    # Rounded down, as loudnorm falls back to dynamic mode if the peak
+    # would overshoot by even the rounding of the filter arguments
+    integrated = math.floor(integrated * 100) / 100
+    return (max(integrated, MIN_INTEGRATED), true_peak,
+            min(max(lra, loudness.lra), MAX_LRA))
+
+def pending_filter(audio_file, target):
+    """Stands in for audio_file's loudnorm filter in commands built before
+    it is measured; never run by ffmpeg."""
+    return f"loudnorm-pending={json.dumps([audio_file, list(target)])}"
+
+def loudnorm_filter(loudness, target):
+    integrated, true_peak, lra = linear_target(loudness, target)
+    return (f"loudnorm=I={integrated:.2f}:TP={true_peak:.2f}:LRA={lra:.2f}"
+            f":measured_I={loudness.integrated:.2f}"
+            f":measured_TP={loudness.true_peak:.2f}"
+            f":measured_LRA={loudness.lra:.2f}"
+            f":measured_thresh={loudness.threshold:.2f}"
+            ":linear=true")
@@ -1,23 +1,34 @@
-import sys
+import queue
+import time
 
 import tkinter as tk
 from tkinter import ttk, filedialog
 from tkinter import messagebox
 
-from layout import layout
+from layout import get_layout
 import impl
+from scheduler import JobState
 from util import *
 
 
-logger = get_logger("ffmpeg-win")
-sys.stdout = LoggerWriter(logger)
-
+root = None
+right_panel = None
 active_page = None  # Tracks the currently active tab
+pages = {}  # Tab name -> its page, built on first display
+widgets = {}  # (tab name, component label) -> widget created for it
+UI_REFRESH_MS = 100  # Progress redraws are capped at one per interval
+progress_pump_running = False
 
 class CustomFrame(tk.Frame):
-    def __init__(self, parent, **kwargs):
+    def __init__(self, parent, tab=None, **kwargs):
         super().__init__(parent, **kwargs)
-        self.active_page = None  # Track the active page (e.g., tab content)
+        self.tab = tab  # Set on tab pages
+        self.callback = None  # Action behind the page's Start button
+        self.progress_bar = None
+        self.property_viewer = None
+        self.properties_request = None  # Pending impl.PropertiesRequest
+        self.waveform_view = None
+        self.waveform_request = None  # Pending impl.WaveformRequest
 
     # Callback to show overwrite confirmation dialog
     def ask_user_for_overwrite(self, file_name):
@@ -27,116 +38,287 @@ class CustomFrame(tk.Frame):
         )
 
     def find_progress_bar(self):
-        # Iterate through all child widgets of the parent
-        for widget in self.winfo_children():
-            print(widget.winfo_name())
-            # Check if the widget is a Progress Bar
-            if isinstance(widget, ttk.Progressbar):
-                return widget
-            # Recursively search in child widgets
-            if isinstance(widget, CustomFrame):
-                result = widget.find_progress_bar()
-                if result:
-                    return result
-        return None  # Return None if Progress Bar is not found
+        return self.progress_bar
 
     def find_widget(self, name):
-        # Iterate through all child widgets of the parent
-        for widget in self.winfo_children():
-            if widget.winfo_name() == name:
-                return widget
-            # Recursively search in child widgets
-            if isinstance(widget, CustomFrame):
-                result = widget.find_widget(name)
-                if result:
-                    return result
-        return None  # Return None if Progress Bar is not found
+        return widgets.get((self.tab.name, name))
+
+    def register(self, label, widget):
+        widgets[(self.tab.name, label)] = widget
 
     def set_entry(self, name, text):
-        print(name, text)
         entry = self.find_widget(name)
         entry.configure(state="normal") 
         entry.delete(0, tk.END)
         entry.insert(0, text)
         entry.configure(state="readonly") 
 
+class WaveformView(tk.Canvas):
+    """Draws a waveform.Peaks between start and end seconds; the wheel zooms
+    around the pointer and dragging pans."""
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.peaks = None
+        self.message = None  # Shown while there are no peaks
+        self.start = 0.0
+        self.end = 0.0
+        self.drag_x = None
+        self.bind("<Configure>", lambda event: self.redraw())
+        self.bind("<MouseWheel>", lambda event: self.zoom(event.x, event.delta < 0))
+        self.bind("<Button-4>", lambda event: self.zoom(event.x, False))  # X11
+        self.bind("<Button-5>", lambda event: self.zoom(event.x, True))
+        self.bind("<ButtonPress-1>", self.begin_drag)
+        self.bind("<B1-Motion>", self.drag)
+
+    def show(self, peaks, message=None):
+        self.peaks = peaks
+        self.message = message
+        self.start = 0.0
+        self.end = peaks.duration if peaks else 0.0
+        self.redraw()
+
+    def zoom(self, x, out):
+        if self.peaks is None:
+            return
+        span = self.end - self.start
+        ratio = x / max(self.winfo_width(), 1)
+        at = self.start + span * ratio
+        span = min(max(span * (2 if out else 0.5),
+                       self.peaks.bucket_seconds(0) * 10), self.peaks.duration)
+        self.start = min(max(at - span * ratio, 0), self.peaks.duration - span)
+        self.end = self.start + span
+        self.redraw()
+
+    def begin_drag(self, event):
+        self.drag_x = event.x
+
+    def drag(self, event):
+        if self.peaks is None or self.drag_x is None:
+            return
+        shift = ((self.drag_x - event.x) * (self.end - self.start) /
+                 max(self.winfo_width(), 1))
+        shift = min(max(shift, -self.start), self.peaks.duration - self.end)
+        self.start += shift
+        self.end += shift
+        self.drag_x = event.x
+        self.redraw()
+
+    def outline(self, highs, lows):
+        # Polygon along highs left to right and back along lows
+        middle = self.winfo_height() / 2
+        points = []
+        for x, value in enumerate(highs):
+            points += [x, middle * (1 - value)]
+        for x in range(len(lows) - 1, -1, -1):
+            points += [x, middle * (1 - lows[x])]
+        return points
+
+    def redraw(self):
+        self.delete("all")
+        width, height = self.winfo_width(), self.winfo_height()
+        if self.peaks is None:
+            if self.message:
+                self.create_text(width / 2, height / 2, text=self.message)
+            return
+        if width < 2 or self.end <= self.start:
+            return
+        # Reads one pyramid level, only the buckets between start and end
+        lows, highs, rms = zip(*self.peaks.columns(
+            self.start, self.end, width).tolist())
+        self.create_polygon(self.outline(highs, lows), fill="steelblue",
+                            outline="steelblue")
+        self.create_polygon(self.outline(rms, [-value for value in rms]),
+                            fill="navy")
+        self.create_text(4, 4, anchor="nw", text=(
+            f"{format_timestamp(self.start)} - {format_timestamp(self.end)}"))
+
 # Function to close the window
 def close_window(event=None):
-    print("Escape key pressed. Closing window...")
+    print("Closing window...")
+    impl.get_scheduler().cancel_all()
     root.destroy()
 
-# Helper functions
-def find_component_recursive(parent, component_type):
-    for widget in parent.winfo_children():
-        if isinstance(widget, component_type):
-            return widget
-        child_result = find_component_recursive(widget, component_type)
-        if child_result:
-            return child_result
-    return None
-
-def find_components_recursive(parent, component_type):
-    components = []
-    for widget in parent.winfo_children():
-        if isinstance(widget, component_type):
-            components.append(widget)
-        components.extend(find_components_recursive(widget, component_type))
-    return components
+# Component types whose widget value goes into input_values
+INPUT_TYPES = ("file_selection", "time_input", "text_input", "options")
+
+def show_file_meta(table, file_properties):
+    # Replace all rows within one Tk callback, so they redraw once
+    table.delete(*table.get_children())
+    for key, value in file_properties.items():
+        table.insert("", "end", values=(key, value))
 
 # Refresh file metadata and update Property Viewer
 def refresh_file_meta(file_path, active_page):
     try:
-        table = find_component_recursive(active_page, ttk.Treeview)
-        if table is not None:
-            file_properties = get_file_properties(file_path)
-            if file_properties:
-                # Clear existing entries
-                for row in table.get_children():
-                    table.delete(row)
-                # Insert new file properties into the table
-                for key, value in file_properties.items():
-                    table.insert("", "end", values=(key, value))
+        refresh_waveform(file_path, active_page)
+        table = active_page.property_viewer
+        if table is None:
+            return
+        if active_page.properties_request is not None:
+            # A probe for the previously selected file is now stale
+            active_page.properties_request.cancel()
+            active_page.properties_request = None
+        file_properties = impl.get_file_properties(file_path, cached_only=True)
+        if file_properties:
+            show_file_meta(table, file_properties)
+            return
+        show_file_meta(table, {"Loading": file_path})
+        request = impl.PropertiesRequest(file_path)
+        active_page.properties_request = request
+        root.after(UI_REFRESH_MS, apply_file_meta, active_page, request)
     except Exception as e:
         print(f"Error in refresh_file_meta: {e}")
 
+def apply_file_meta(page, request):
+    # Polled on the Tk loop until the probe thread is done
+    if page.properties_request is not request:
+        return  # Superseded by another selection
+    if not request.done.is_set():
+        root.after(UI_REFRESH_MS, apply_file_meta, page, request)
+        return
+    page.properties_request = None
+    try:
+        show_file_meta(page.property_viewer, request.result or {
+            "Error": f"Could not read {request.file_path}"})
+    except tk.TclError as e:
+        print(f"Error in apply_file_meta: {e}")
+
+def refresh_waveform(file_path, page):
+    view = page.waveform_view
+    if view is None:
+        return
+    if page.waveform_request is not None:
+        page.waveform_request.cancel()  # Stops decoding the previous file
+    view.show(None, "Loading waveform...")
+    request = impl.WaveformRequest(file_path)
+    page.waveform_request = request
+    root.after(UI_REFRESH_MS, apply_waveform, page, request)
+
+def apply_waveform(page, request):
+    if page.waveform_request is not request:
+        return
+    if not request.done.is_set():
+        root.after(UI_REFRESH_MS, apply_waveform, page, request)
+        return
+    page.waveform_request = None
+    try:
+        page.waveform_view.show(request.result, "No waveform for this file")
+    except tk.TclError as e:
+        print(f"Error in apply_waveform: {e}")
+
 def start(active_page, action_callback):
     try:
         input_values = {}
-        input_fields = find_components_recursive(active_page, tk.Entry)
-        dropdowns = find_components_recursive(active_page, ttk.Combobox)
-
-        for field in input_fields:
-            print(field)
-            try:
-                label = field.master.winfo_children()[0].cget("text")  # Label associated with input
-                input_values[label] = field.get()
-            except tk.TclError:
-                ...
-
-        for dropdown in dropdowns:
-            print(dropdown)
-            try:
-                label = dropdown.master.winfo_children()[0].cget("text")  # Label associated with dropdown
-                input_values[label] = dropdown.get()
-            except tk.TclError:
-                ...
+        for row in active_page.tab.rows:
+            for component in row:
+                if component.type in INPUT_TYPES:
+                    widget = active_page.find_widget(component.label)
+                    input_values[component.label] = widget.get()
 
         print(f"Input Values: {input_values}")
         action_callback(input_values, active_page)
+        start_progress_pump()
     except Exception as e:
         print(f"Error in start: {e}")
 
+# Progress of all running jobs is applied here, on the Tk main thread
+def show_progress(job, progress):
+    if progress.out_time is None or not job.total_duration:
+        return
+    now = time.time()
+    elapsed = now - job.time_start
+    percent = min(progress.out_time / job.total_duration, 1)
+    if percent: ete = elapsed / percent
+    else: ete = 0
+    remaining = ete - elapsed
+    eta = now + remaining
+    text = (f'elapsed: {convert_seconds_to_hhmmss(elapsed)}, '
+            f'remaining: {convert_seconds_to_hhmmss(remaining)}, '
+            f'eta: {convert_epoch_to_hhmmss(eta)}')
+    details = job.describe(progress) if job.describe else None
+    if details:
+        text = f'{text}, {details}'
+    job.owner.find_progress_bar()['value'] = int(percent * 100)
+    job.owner.set_entry("progress_text", text)
+
+def show_state(job, state):
+    if state is JobState.QUEUED:
+        text = "queued"
+    elif state is JobState.RUNNING:
+        job.owner.find_progress_bar()['value'] = 0
+        text = "running"
+    else:
+        elapsed = convert_seconds_to_hhmmss(
+            (job.time_end or time.time()) - (job.time_start or job.time_queued))
+        if state is JobState.DONE:
+            job.owner.find_progress_bar()['value'] = 100
+            text = f'done in {elapsed}'
+        elif state is JobState.CANCELLED:
+            text = f'cancelled after {elapsed}'
+        else:
+            text = f'failed (exit code {job.returncode}) after {elapsed}'
+    if job.note:
+        text = f'{text}, {job.note}'
+    job.owner.set_entry("progress_text", text)
+
+def pump_progress():
+    global progress_pump_running
+    # Drain everything posted since the last tick, keep only the latest
+    # state and progress per job
+    states = {}
+    latest = {}
+    while True:
+        try:
+            job, item = impl.progress_events.get_nowait()
+        except queue.Empty:
+            break
+        if isinstance(item, JobState):
+            states[job] = item
+            latest.pop(job, None)
+        else:
+            latest[job] = item
+
+    for job, state in states.items():
+        try:
+            show_state(job, state)
+        except (tk.TclError, AttributeError, TypeError) as e:
+            print(f"Error in show_state: {e}")
+    for job, progress in latest.items():
+        try:
+            show_progress(job, progress)
+        except (tk.TclError, AttributeError, TypeError) as e:
+            print(f"Error in show_progress: {e}")
+
+    if impl.get_scheduler().active_jobs() or not impl.progress_events.empty():
+        root.after(UI_REFRESH_MS, pump_progress)
+    else:
+        progress_pump_running = False
+
+def cancel_jobs(page):
+    scheduler = impl.get_scheduler()
+    for job in scheduler.active_jobs():
+        if job.owner is page:
+            print(f"Cancelling {job}")
+            scheduler.cancel(job)
+
+def start_progress_pump():
+    global progress_pump_running
+    if not progress_pump_running:
+        progress_pump_running = True
+        root.after(UI_REFRESH_MS, pump_progress)
+
 # Component creation functions
-def create_file_selection(parent, label, refresh_func=None):
+def create_file_selection(parent, component, refresh_func=None):
     frame = CustomFrame(parent)
-    tk.Label(frame, text=label).pack(side="left")
+    tk.Label(frame, text=component.label).pack(side="left")
     entry = tk.Entry(frame, width=40, state="readonly")
     entry.pack(side="left", padx=5)
     tk.Button(frame, text="Browse", command=lambda: browse_file(
-        entry, refresh_func)).pack(side="left")
+        entry, parent, refresh_func)).pack(side="left")
     frame.pack(fill="x", pady=5)
+    parent.register(component.label, entry)
 
-def create_property_viewer(parent):
+def create_property_viewer(parent, component):
     frame = CustomFrame(parent)
     table = ttk.Treeview(frame, columns=("Key", "Value"),
                          show="headings", height=8)
@@ -147,6 +329,16 @@ def create_property_viewer(parent):
     table.configure(yscroll=scrollbar.set)
     scrollbar.pack(side="right", fill="y")
     frame.pack(fill="x", pady=5)
+    parent.register(component.label, table)
+    parent.property_viewer = table
+
+def create_waveform(parent, component):
+    frame = CustomFrame(parent)
+    view = WaveformView(frame, height=120, bg="white", highlightthickness=0)
+    view.pack(fill="x", expand=True)
+    frame.pack(fill="x", pady=5)
+    parent.register(component.label, view)
+    parent.waveform_view = view
 
 def create_time_input(parent, component):
     label_text = component.label
@@ -158,6 +350,7 @@ def create_time_input(parent, component):
     frame.pack(fill="x", pady=5)
     if default is not None:
         input_entry.insert(0, default)  # Default value
+    parent.register(label_text, input_entry)
 
 def create_text_input(parent, component):
     label_text = component.label
@@ -169,23 +362,17 @@ def create_text_input(parent, component):
     frame.pack(fill="x", pady=5)
     if default is not None:
         input_entry.insert(0, default)  # Default value
+    parent.register(label_text, input_entry)
 
 def create_button(parent, component):
     button_text = component.label
     frame = CustomFrame(parent)
-    callback = None
-    print(active_tab.name, ("Loop Video" in active_tab.name))
-    callback = getattr(impl, active_tab.callback)
-    # if "Loop Video" in active_tab.name:
-    #     callback = loop_video
-    # elif "Trim Audio" in active_tab.name:
-    #     callback = trim_audio
-    # elif "Combine A&V" in active_tab.name:
-    #     callback = combine_audio_video
+    callback = getattr(impl, parent.tab.callback)
     tk.Button(frame, text=button_text, command=lambda: start(
-        active_page, callback)).pack()
+        parent, callback)).pack()
     frame.pack(fill="x", pady=5)
-    root.bind("<Return>", lambda event: start(active_page, callback))
+    parent.register(button_text, frame)
+    parent.callback = callback
 
 def create_options(parent, component):
     label_text = component.label
@@ -198,18 +385,23 @@ def create_options(parent, component):
     frame.pack(fill="x", pady=5)
     if default is not None:
         combo_box.set(default)  # Default value
+    parent.register(label_text, combo_box)
 
 def create_progress_bar(parent, component):
-    label = component.label
-    print('create_progress_bar', label)
     frame = CustomFrame(parent)
     progress = ttk.Progressbar(frame, length=200)
     progress.pack(side="left")
-    tk.Entry(frame, width=60, name="progress_text", state="readonly").pack(
-        side="left", padx=5)
+    progress_text = tk.Entry(frame, width=60, name="progress_text",
+                             state="readonly")
+    progress_text.pack(side="left", padx=5)
+    tk.Button(frame, text="Cancel", command=lambda: cancel_jobs(
+        parent)).pack(side="left")
     frame.pack(fill="x", pady=5)
+    parent.register(component.label, progress)
+    parent.register("progress_text", progress_text)
+    parent.progress_bar = progress
 
-def browse_file(entry, refresh_func=None):
+def browse_file(entry, page, refresh_func=None):
     try:
         file_path = filedialog.askopenfilename()
         if file_path:
@@ -217,18 +409,17 @@ def browse_file(entry, refresh_func=None):
             entry.delete(0, "end")
             entry.insert(0, file_path)
             entry.config(state="readonly")
-            if refresh_func and active_page:
-                refresh_func(file_path, active_page)
+            if refresh_func:
+                refresh_func(file_path, page)
     except Exception as e:
         print(f"Error in browse_file: {e}")
 
 def display_tab_content(tab_frame, rows):
-    for widget in tab_frame.winfo_children():
-        widget.destroy()
+    # Built once per tab; every component registers its widget by label
     for row in rows:
         for component in row:
             if component.type == "file_selection":
-                create_file_selection(tab_frame, component.label,
+                create_file_selection(tab_frame, component,
                                       refresh_file_meta)
             elif component.type == "time_input":
                 create_time_input(tab_frame, component)
@@ -239,38 +430,61 @@ def display_tab_content(tab_frame, rows):
             elif component.type == "options":
                 create_options(tab_frame, component)
             elif component.type == "property_viewer":
-                create_property_viewer(tab_frame)
+                create_property_viewer(tab_frame, component)
             elif component.type == "progress_bar":
                 create_progress_bar(tab_frame, component)
+            elif component.type == "waveform":
+                create_waveform(tab_frame, component)
 
 def switch_tab(tab_name, tab_frame):
+    # Pages stay alive when hidden, so inputs and progress of a tab survive
+    # switching away from it
     global active_page
-    global active_tab
-    for tab in layout.tabs:
+    for tab in get_layout().tabs:
         if tab.name == tab_name:
-            active_tab = tab
-            active_page = tab_frame
-            display_tab_content(tab_frame, tab.rows)
+            page = pages.get(tab_name)
+            if page is None:
+                page = CustomFrame(tab_frame, tab=tab, bg="white")
+                display_tab_content(page, tab.rows)
+                pages[tab_name] = page
+            if active_page is not None and active_page is not page:
+                active_page.pack_forget()
+            page.pack(fill="both", expand=True)
+            active_page = page
+            if page.callback:
+                root.bind("<Return>", lambda event: start(page, page.callback))
+            else:
+                root.unbind("<Return>")
             break
 
+def build_window():
+    global root, right_panel
+    layout = get_layout()
+    root = tk.Tk()
+    root.title("FFMPEG for the Win")
+    root.geometry("800x600")
+    root.bind("<Escape>", close_window)
+    root.protocol("WM_DELETE_WINDOW", close_window)
+
+    # Left and right panels
+    left_panel = CustomFrame(root, width=150, bg="lightgray")
+    left_panel.pack(side="left", fill="y")
+    right_panel = CustomFrame(root, bg="white")
+    right_panel.pack(side="right", fill="both", expand=True)
+
+    # Tab buttons
+    for tab in layout.tabs:
+        tk.Button(left_panel, text=tab.name, command=lambda t=tab.name:
+                  switch_tab(t, right_panel)).pack(pady=10)
+
+    # Show first tab by default
+    switch_tab(layout.tabs[0].name, right_panel)
+    return root
+
 # Main Application
-root = tk.Tk()
-root.title("FFMPEG for the Win")
-root.geometry("800x600")
-root.bind("<Escape>", close_window)
-
-# Left and right panels
-left_panel = CustomFrame(root, width=150, bg="lightgray")
-left_panel.pack(side="left", fill="y")
-right_panel = CustomFrame(root, bg="white")
-right_panel.pack(side="right", fill="both", expand=True)
-
-# Tab buttons
-for tab in layout.tabs:
-    tk.Button(left_panel, text=tab.name, command=lambda t=tab.name:
-              switch_tab(t, right_panel)).pack(pady=10)
-
-# Show first tab by default
-switch_tab(layout.tabs[0].name, right_panel)
-
-root.mainloop()
+def main():
+    redirect_stdout("ffmpeg-win")
+    build_window().mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""pydantic models of ffprobe's JSON output; probe.py parses into them."""
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+
+class StreamInfo(BaseModel):
+    index: int
+    codec_type: Optional[str] = None  # "audio", "video", "subtitle", ...
+    codec_name: Optional[str] = None
+    profile: Optional[str] = None
+    time_base: Optional[str] = None
+    start_time: Optional[float] = None
+    duration: Optional[float] = None
+    bit_rate: Optional[int] = None
+    nb_frames: Optional[int] = None
+    # Audio
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    channel_layout: Optional[str] = None
+    sample_fmt: Optional[str] = None
+    bits_per_raw_sample: Optional[int] = None
+    # Video
+    width: Optional[int] = None
+    height: Optional[int] = None
+    pix_fmt: Optional[str] = None
+    r_frame_rate: Optional[str] = None
+    disposition: Dict[str, int] = {}  # e.g. {"default": 1, "attached_pic": 0}
+    tags: Dict[str, str] = {}
+
+    @property
+    def attached_pic(self):
+        """Cover art: a still image tagged onto an audio file, not video."""
+        return bool(self.disposition.get("attached_pic"))
+
+class ChapterInfo(BaseModel):
+    id: int
+    start_time: float
+    end_time: float
+    title: Optional[str] = None
+
+class FormatInfo(BaseModel):
+    filename: str
+    format_name: Optional[str] = None
+    format_long_name: Optional[str] = None
+    start_time: Optional[float] = None
+    duration: Optional[float] = None
+    size: Optional[int] = None
+    bit_rate: Optional[int] = None
+    nb_streams: Optional[int] = None
+    tags: Dict[str, str] = {}
+
+class MediaInfo(BaseModel):
+    format: FormatInfo
+    streams: List[StreamInfo] = []
+    chapters: List[ChapterInfo] = []
+
+    @property
+    def duration(self):
+        """Exact duration in seconds, falling back to the longest stream."""
+        if self.format.duration is not None:
+            return self.format.duration
+        durations = [s.duration for s in self.streams if s.duration is not None]
+        return max(durations) if durations else None
+
+    @property
+    def audio_streams(self):
+        return [s for s in self.streams if s.codec_type == "audio"]
+
+    @property
+    def video_streams(self):
+        return [s for s in self.streams
+                if s.codec_type == "video" and not s.attached_pic]
@@ -0,0 +1,185 @@
+"""Reuse of earlier outputs for identical jobs.
+
+A job's key hashes the fingerprints of the files it reads (size, mtime and
+a sampled content hash) with its ffmpeg arguments, where input, output and
+intermediate paths are replaced by placeholders. After a job succeeds its
+output is hardlinked into MEMO_DIR under that key; a later job with the
+same key links or copies the stored file to its own output instead of
+running ffmpeg. Outputs that can't be hardlinked, e.g. on another drive
+than MEMO_DIR, are only copied there with MEMO_COPY, and outputs larger
+than MEMO_MAX_BYTES aren't kept. Entries are evicted least recently used
+first once MEMO_DIR exceeds MEMO_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from cache import (CACHE_DIR, atomic_write, evict_entries, file_entries,
+                   get_probe_cache, temp_path_for)
+
+
+MEMO_DIR = os.path.join(CACHE_DIR, "outputs")
+MEMO_MAX_BYTES = 20 * 1024 ** 3
+MEMO_ENABLED = True  # Off, every job runs ffmpeg (e.g. when benchmarking)
+MEMO_COPY = False  # Store outputs by copying when they can't be hardlinked
+SAMPLE_BYTES = 64 * 1024  # Read at the start, middle and end of a file
+
+def sample_hash(file_path):
+    """Hash of a file's size and three samples of its content."""
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    with open(file_path, "rb") as f:
+        for offset in (0, size // 2, size - SAMPLE_BYTES):
+            f.seek(max(0, offset))
+            digest.update(f.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+def file_fingerprint(file_path):
+    """[size, mtime_ns, sample hash], hashed once per (path, size, mtime)."""
+    fingerprints = get_probe_cache("fingerprint")
+    value = fingerprints.get(file_path)
+    if value is None:
+        stat = os.stat(file_path)
+        value = [stat.st_size, stat.st_mtime_ns, sample_hash(file_path)]
+        fingerprints.put(file_path, value)
+    return value
+
+def concat_sources(list_path):
+    """Media files an ffconcat script reads, following nested scripts."""
+    sources = []
+    directory = os.path.dirname(os.path.abspath(list_path))
+    with open(list_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("file "):
+                continue
+            path = line[5:].strip()
+            if path.startswith("'") and path.endswith("'"):
+                path = path[1:-1].replace("'\\''", "'")
+            path = os.path.join(directory, path)
+            if path.endswith(".ffconcat") and os.path.exists(path):
+                sources.extend(concat_sources(path))
+            else:
+                sources.append(path)
+    return sources
+
+def under(path, prefix):
+    return path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+
+def job_key(commands, output_file, temp_paths=()):
+    """Key of a job running commands (in order) to produce output_file, or
+    None if a file it reads can't be fingerprinted or MEMO_ENABLED is off."""
+    if not MEMO_ENABLED:
+        return None
+    placeholders = {os.path.abspath(output_file): "<output>"}
+    for i, path in enumerate(temp_paths):
+        placeholders[os.path.abspath(path)] = f"<temp{i}>"
+    scratch = list(placeholders)
+
+    inputs = []
+    for command in commands:
+        for flag, value in zip(command, command[1:]):
+            if flag != "-i":
+                continue
+            path = os.path.abspath(value)
+            if path.endswith(".ffconcat") and os.path.exists(path):
+                inputs.extend(concat_sources(path))
+            inputs.append(path)
+    inputs = [path for path in dict.fromkeys(inputs)
+              if not any(under(path, prefix) for prefix in scratch)]
+    for i, path in enumerate(inputs):
+        placeholders[path] = f"<input{i}>"
+
+    # Longest first, so a path is never replaced by a prefix of it
+    replacements = sorted(placeholders.items(), key=lambda p: -len(p[0]))
+    normalized = []
+    for command in commands:
+        args = []
+        for arg in command:
+            if arg in ("-y", "-n"):
+                continue  # Overwrite policy doesn't change the output
+            path = os.path.abspath(arg)
+            for prefix, placeholder in replacements:
+                if under(path, prefix):
+                    arg = placeholder + path[len(prefix):].replace(os.sep, "/")
+                    break
+            args.append(arg)
+        normalized.append(args)
+    try:
+        fingerprints = [file_fingerprint(path) for path in inputs]
+    except OSError as e:
+        print(f"Error while fingerprinting inputs: {e}")
+        return None
+    data = json.dumps([fingerprints, os.path.splitext(output_file)[1],
+                       normalized])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def entry_path(key, output_file):
+    return os.path.join(MEMO_DIR, key + os.path.splitext(output_file)[1])
+
+def link_or_copy(source, destination, copy=True):
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return  # Already linked; renaming onto it would be a no-op
+    temp_path = temp_path_for(destination)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)  # Left by a crash; never copy into another link
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        if not copy:
+            raise
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+def restore(key, output_file):
+    """Put the stored output for key at output_file; False on a miss."""
+    path = entry_path(key, output_file)
+    try:
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            recorded = json.load(f)
+        if sample_hash(path) != recorded["hash"]:
+            # A hardlinked output was written to in place since it was stored
+            forget(path)
+            return False
+        link_or_copy(path, output_file)
+        os.utime(f"{path}.json")
+        return True
+    except (OSError, ValueError, KeyError):
+        return False
+
+def store(key, output_file):
+    """Keep output_file as the result for key, unless it is larger than
+    MEMO_MAX_BYTES or needs copying without MEMO_COPY."""
+    path = entry_path(key, output_file)
+    try:
+        if os.path.getsize(output_file) > MEMO_MAX_BYTES:
+            return  # Would be the first to be evicted
+        os.makedirs(MEMO_DIR, exist_ok=True)
+        link_or_copy(output_file, path, copy=MEMO_COPY)
+        record = json.dumps({"hash": sample_hash(path)}).encode("utf-8")
+        atomic_write(f"{path}.json", lambda f: f.write(record))
+    except OSError as e:
+        print(f"Not storing {output_file} for reuse: {e}")
+        return
+    evict_outputs()
+
+def forget(path):
+    for p in (path, f"{path}.json"):
+        try:
+            os.remove(p)
+        except OSError:
+            ...
+
+def evict_outputs(max_bytes=MEMO_MAX_BYTES):
+    """Drop least recently used entries beyond max_bytes.
+
+    Hits touch an entry's .json record, so its mtime is the entry's last
+    use.
+    """
+    entries = []
+    for used, _, record in file_entries(MEMO_DIR, ".json"):
+        try:
+            entries.append((used, os.path.getsize(record[:-5]), record[:-5]))
+        except OSError:
+            ...  # Record without its output
+    evict_entries(entries, max_bytes, remove=forget)
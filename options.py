@@ -0,0 +1,59 @@
+"""Choices of the tabs' option menus, label -> value.
+
+Kept apart from the pydantic layout so the command builders can use them
+without importing pydantic.
+"""
+
+
+AUDIO_CODECS = {
+    "FLAC": "flac",
+    "AAC": "aac",
+}
+
+SAMPLING_RATES = {
+    "48 kHz": "48000",
+    "96 kHz": "96000",
+    "128 kHz": "128000",
+}
+
+BIT_RATES = {
+    "128k": "128k",
+    "256k": "256k",
+    "384k": "384k",
+}
+
+LOOP_MODES = {
+    "Auto": "auto",  # Stream copy when the container allows, else re-encode
+    "Stream Copy": "copy",
+    "Re-encode": "reencode",
+    "Smart Render": "smart",  # Stream copy, re-encode only the last GOP
+}
+
+SEEK_MODES = {
+    "Fast (Keyframe)": "input",  # Seek before -i, start on a keyframe
+    "Accurate (Decode)": "output",  # Seek after -i, demux up to the start
+    "Smart Render": "smart",  # Frame accurate, re-encode only the edge GOPs
+}
+
+# Trim Start Time and Duration to the sound between leading and trailing
+# silence quieter than this many dBFS instead
+AUTO_TRIM_MODES = {
+    "Off": None,
+    "Silence (-60 dB)": -60.0,
+    "Silence (-50 dB)": -50.0,
+    "Silence (-40 dB)": -40.0,
+}
+
+# Two-pass EBU R128 normalization of the re-encoded audio to (integrated
+# LUFS, true peak dBTP, loudness range LU)
+LOUDNESS_TARGETS = {
+    "Off": None,
+    "EBU R128 (-23 LUFS)": (-23.0, -1.0, 7.0),
+    "Podcast (-16 LUFS)": (-16.0, -1.5, 11.0),
+    "Streaming (-14 LUFS)": (-14.0, -1.0, 11.0),
+}
+
+ENCODING_MODES = {
+    "Single Process": "single",
+    "Parallel Chunks": "chunked",  # One ffmpeg per chunk of the timeline
+}
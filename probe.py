@@ -0,0 +1,73 @@
+import json
+import subprocess
+
+from cache import get_probe_cache
+
+
+FFPROBE_COMMAND = [
+    "ffprobe", "-v", "error",
+    "-print_format", "json",
+    "-show_streams", "-show_format", "-show_chapters",
+]
+
+def clean(values):
+    # ffprobe reports unavailable values as "N/A"
+    return {k: v for k, v in values.items() if v != "N/A"}
+
+def parse_ffprobe_json(data):
+    # pydantic loads on the first parse, not when probe is imported
+    from media import ChapterInfo, FormatInfo, MediaInfo, StreamInfo
+    chapters = [ChapterInfo(id=c["id"], start_time=c["start_time"],
+                            end_time=c["end_time"],
+                            title=c.get("tags", {}).get("title"))
+                for c in data.get("chapters", [])]
+    return MediaInfo(format=FormatInfo(**clean(data.get("format", {}))),
+                     streams=[StreamInfo(**clean(s))
+                              for s in data.get("streams", [])],
+                     chapters=chapters)
+
+def ffprobe_json(filename, on_spawn=None):
+    """Run ffprobe once and return its JSON output as a dict.
+
+    on_spawn gets the ffprobe Popen, e.g. to kill a probe no longer wanted.
+    """
+    process = subprocess.Popen(FFPROBE_COMMAND + [filename],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               stdin=subprocess.DEVNULL,
+                               encoding="utf-8", errors="replace")
+    if on_spawn is not None:
+        on_spawn(process)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.strip() or
+                           f"ffprobe exited with {process.returncode}")
+    return json.loads(stdout)
+
+def cached_probe(filename):
+    """MediaInfo from the probe cache, or None without running ffprobe."""
+    try:
+        data = get_probe_cache().get(filename)
+        return parse_ffprobe_json(data) if data is not None else None
+    except Exception as e:
+        print(f"Error while reading probe cache: {e}")
+        return None
+
+def probe_media(filename, on_spawn=None):
+    """Return MediaInfo for a file, probing only if it is new or has changed."""
+    probe_cache = get_probe_cache()
+    try:
+        data = probe_cache.get(filename)
+    except Exception as e:
+        print(f"Error while reading probe cache: {e}")
+        data = None
+    try:
+        if data is None:
+            data = ffprobe_json(filename, on_spawn)
+            try:
+                probe_cache.put(filename, data)
+            except Exception as e:
+                print(f"Error while writing probe cache: {e}")
+        return parse_ffprobe_json(data)
+    except Exception as e:
+        print(f"Error while probing {filename}: {e}")
+        return None
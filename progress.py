@@ -0,0 +1,47 @@
+import collections
+
+
+# Ask ffmpeg for its key=value progress stream on stdout; stderr keeps the
+# diagnostics, without the carriage-return stats line.
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+Progress = collections.namedtuple(
+    "Progress", ["out_time", "speed", "total_size", "bitrate", "end"])
+
+def with_progress(command):
+    """Insert PROGRESS_ARGS right after the executable."""
+    return command[:1] + PROGRESS_ARGS + command[1:]
+
+def parse_number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None  # "N/A" until ffmpeg has something to report
+
+class ProgressParser:
+    """Incremental parser for ffmpeg's -progress output.
+
+    ffmpeg writes a block of key=value lines per update and closes each
+    block with progress=continue or progress=end. feed() takes one line at
+    a time and returns a Progress when a block is complete, else None.
+    """
+    def __init__(self):
+        self.block = {}
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self.block[key] = value
+            return None
+        block, self.block = self.block, {}
+        out_time_us = parse_number(block.get("out_time_us"), int)
+        speed = block.get("speed", "").rstrip("x").strip()
+        bitrate = block.get("bitrate", "").replace("kbits/s", "").strip()
+        return Progress(
+            out_time=out_time_us / 1e6 if out_time_us is not None else None,
+            speed=parse_number(speed),
+            total_size=parse_number(block.get("total_size"), int),
+            bitrate=parse_number(bitrate),
+            end=(value == "end"))
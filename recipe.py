@@ -0,0 +1,365 @@
+"""Recipes: trim/loop/combine steps compiled into as few ffmpeg runs as possible.
+
+A recipe lists steps in order. Each step names an operation and carries the
+same input values as the matching tab, keyed by layout label. A file or
+duration value of "@name" refers to the output of the earlier step with
+that "name":
+
+    {
+      "operation": "recipe",
+      "steps": [
+        {"name": "audio", "operation": "trim_audio", "Select File": "mix.wav",
+         "Start Time": "00:00:10", "Duration": "01:00:00"},
+        {"name": "video", "operation": "loop_video", "Select File": "clip.mp4",
+         "Duration": "@audio"},
+        {"operation": "combine_audio_video", "Select Video File": "@video",
+         "Select Audio File": "@audio", "Audio Codec": "AAC",
+         "Sampling Rate": "48 kHz", "Bit Rate": "384k"}
+      ]
+    }
+
+Trims and loops are lowered onto the input that reads them (-ss, -t and
+-stream_loop, or atrim/aloop in a -filter_complex for audio), so the recipe
+above runs as a single ffmpeg command reading mix.wav and clip.mp4 directly.
+A step is written to an intermediate file only where that isn't possible:
+looping a cut of a video, a smart render or chunked encode, or a combine
+that a later step reads. Steps with smart render, accurate seeking,
+chunked modes or loudness normalization run through their tab's builders,
+which probe or measure their inputs, so they have to read source files.
+So do auto trims, whose silence is detected when the recipe is compiled,
+and fast trims of video, which start on the keyframe at or before their
+start like the Trim tab's. The last step's output, and that of any step
+with an "Output File", is kept.
+
+Run a recipe through batch.py like any other job.
+"""
+import collections
+import hashlib
+import json
+import os
+
+import impl
+from concat import work_dir_for
+from keyframes import keyframe_before
+from options import (AUDIO_CODECS, AUTO_TRIM_MODES, BIT_RATES, ENCODING_MODES,
+                     LOOP_MODES, LOUDNESS_TARGETS, SAMPLING_RATES, SEEK_MODES)
+from probe import probe_media
+from util import *
+
+
+REFERENCE_PREFIX = "@"
+
+OUTPUT_SUFFIXES = {
+    "trim_audio": "_trimmed",
+    "loop_video": "_loop",
+    "combine_audio_video": "_audio",
+}
+
+# What ffmpeg reads for a step: one file with input options (start,
+# duration, loop) and an audio filter chain producing length seconds.
+# period is the length of one play of a looped file, stage how many stages
+# must finish before file exists, and origin the source file outputs are
+# named after.
+Clip = collections.namedtuple(
+    "Clip", ["file", "start", "duration", "loop", "filters", "length",
+             "period", "stage", "video", "origin"],
+    defaults=[0.0, None, False, (), None, None, 0, False, None])
+
+def is_reference(value):
+    return isinstance(value, str) and value.startswith(REFERENCE_PREFIX)
+
+def clip_input_args(clip):
+    args = []
+    if clip.loop:
+        args += ["-stream_loop", "-1"]
+    if clip.start:
+        args += ["-ss", format_seconds(clip.start)]
+    if clip.duration is not None:
+        args += ["-t", format_seconds(clip.duration)]
+    return args + ["-i", clip.file]
+
+def is_whole_file(clip):
+    return (not clip.loop and not clip.start and clip.duration is None and
+            not clip.filters)
+
+class RecipeCompiler:
+    """Lowers a recipe to a JobSpec whose stages hold the intermediate
+    steps and whose command writes the last step's output."""
+    def __init__(self, recipe):
+        self.recipe = recipe
+        self.steps = recipe.get("steps") or []
+        if not self.steps:
+            raise ValueError("Recipe has no steps")
+        self.results = {}
+        self.stages = []
+        self.final = None
+        self.temp_paths = []
+        self.work_dir = None
+        self.intermediates = 0
+        self.prepares = []  # prepare hooks of steps run by their builders
+
+    def add_command(self, stage, command, seconds):
+        while len(self.stages) <= stage:
+            self.stages.append([])
+        self.stages[stage].append((command, seconds))
+
+    def emit(self, step, stage, command, seconds, output_file):
+        # The last step's command becomes the JobSpec's command
+        if step is self.steps[-1]:
+            self.final = (stage, command, seconds, output_file)
+        else:
+            self.add_command(stage, command, seconds)
+
+    def temp_output(self, origin, ext):
+        if self.work_dir is None:
+            digest = hashlib.sha1(json.dumps(
+                self.recipe, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+            self.work_dir = work_dir_for(os.path.join(
+                os.path.dirname(os.path.abspath(origin)), f"recipe-{digest}"))
+            self.temp_paths.append(self.work_dir)
+        self.intermediates += 1
+        return os.path.join(self.work_dir, f"step{self.intermediates}{ext}")
+
+    def source(self, value):
+        if is_reference(value):
+            name = value[len(REFERENCE_PREFIX):]
+            if name not in self.results:
+                raise ValueError(f"Unknown step {value}")
+            return self.results[name]
+        media = probe_media(value)
+        if media is None:
+            raise ValueError(f"Could not probe {value}")
+        return Clip(value, video=bool(media.video_streams), origin=value)
+
+    def clip_duration(self, clip):
+        if clip.length is not None:
+            return clip.length
+        if clip.duration is not None:
+            return clip.duration
+        if clip.stage:
+            raise ValueError(f"Length of {clip.file} is unknown before it is rendered")
+        return impl.media_duration(clip.file) - clip.start
+
+    def duration(self, value):
+        if is_reference(value):
+            return self.clip_duration(self.source(value))
+        seconds = duration_to_seconds(value)
+        if seconds is None:
+            raise ValueError(f"Invalid duration {value}")
+        return seconds
+
+    def output_file(self, step):
+        """Where a step's output is kept, None for steps only read by later
+        steps."""
+        if step is not self.steps[-1] and not step.get("Output File"):
+            return None
+        operation = step["operation"]
+        field = ("Select Video File" if operation == "combine_audio_video"
+                 else "Select File")
+        return impl.output_path(self.source(step.get(field)).origin,
+                                step.get("Output File"),
+                                OUTPUT_SUFFIXES[operation])
+
+    def clip_command(self, clip, output_file):
+        command = ["ffmpeg", "-y", *clip_input_args(clip)]
+        if clip.filters:
+            # Only audio-only clips carry filters; the audio is re-encoded
+            command += ["-filter_complex", f"[0:a]{','.join(clip.filters)}[a]",
+                        "-map", "[a]"]
+        else:
+            command += ["-map", "0", "-c", "copy"]
+            if clip.start:
+                command += ["-avoid_negative_ts", "make_zero"]
+        return command + [output_file]
+
+    def materialize(self, clip):
+        """Clip reading a file that holds clip's output."""
+        if is_whole_file(clip):
+            return clip
+        path = self.temp_output(clip.origin, os.path.splitext(clip.file)[1])
+        self.add_command(clip.stage, self.clip_command(clip, path),
+                         self.clip_duration(clip))
+        return Clip(path, length=self.clip_duration(clip),
+                    stage=clip.stage + 1, video=clip.video, origin=clip.origin)
+
+    def fallback(self, step, builder, file_fields, output_file, values=None):
+        """Run a step through its tab's command builder, which needs its
+        inputs to be files that exist now. values replace the step's own
+        input values if given."""
+        values = dict(step if values is None else values)
+        clips = []
+        for field in file_fields:
+            clip = self.materialize(self.source(step.get(field)))
+            if clip.stage:
+                raise ValueError(
+                    f"{step['operation']} with these options must read source "
+                    f"files, not {step.get(field)}")
+            values[field] = clip.file
+            clips.append(clip)
+        if "Duration" in values:
+            values["Duration"] = format_seconds(self.duration(values["Duration"]))
+        if output_file is None:
+            output_file = self.temp_output(
+                clips[0].origin, os.path.splitext(clips[0].file)[1])
+        # Builders put their output next to their input, unless the name
+        # they are given is an absolute path
+        values["Output File"] = os.path.splitext(os.path.abspath(output_file))[0]
+        spec = builder(values)
+        if os.path.abspath(spec.output_file) != os.path.abspath(output_file):
+            raise ValueError(f"{step['operation']} would write "
+                             f"{spec.output_file}, not {output_file}")
+        stages = spec.stages or [[(spec.command, spec.duration)]]
+        for i, stage in enumerate(stages):
+            for command, seconds in stage:
+                if command is spec.command:
+                    self.emit(step, i, command, seconds, output_file)
+                else:
+                    self.add_command(i, command, seconds)
+        self.temp_paths += spec.temp_paths or []
+        if spec.prepare is not None:
+            self.prepares.append(spec.prepare)
+        return Clip(output_file, length=spec.duration, stage=len(stages),
+                    video=any(c.video for c in clips), origin=clips[0].origin)
+
+    def trim(self, step, output_file):
+        seek_mode = SEEK_MODES[step.get("Seek Mode") or "Fast (Keyframe)"]
+        threshold = AUTO_TRIM_MODES[step.get("Auto Trim") or "Off"]
+        values = step
+        if threshold is not None:
+            values = self.auto_trimmed(step, threshold)
+        if seek_mode in ("smart", "output"):
+            return self.fallback(step, impl.trim_command, ["Select File"],
+                                 output_file, values)
+        clip = self.source(step.get("Select File"))
+        start = duration_to_seconds(values.get("Start Time") or "0")
+        duration = min(self.duration(values.get("Duration")),
+                       self.clip_duration(clip) - start)
+        if clip.filters:
+            return clip._replace(length=duration, filters=clip.filters + (
+                f"atrim=start={format_seconds(start)}"
+                f":duration={format_seconds(duration)}",
+                "asetpts=PTS-STARTPTS"))
+        if clip.loop:
+            # The looped timeline at t reads the source at (start + t) mod
+            # its length, as -stream_loop rewinds to 0 after the first play
+            start = (clip.start + start) % clip.period
+        else:
+            start = clip.start + start
+        if clip.video:
+            # Start the stream copy on a keyframe and keep the end point,
+            # as trim_command does
+            if clip.stage:
+                raise ValueError(f"Fast (Keyframe) trim must read source "
+                                 f"files, not {step.get('Select File')}")
+            actual_start = keyframe_before(clip.file, start)
+            if actual_start != start:
+                print(f"Trim start {start} snapped to keyframe at "
+                      f"{format_timestamp(actual_start)}")
+            duration += start - actual_start
+            start = actual_start
+        return clip._replace(start=start, duration=duration, length=None)
+
+    def auto_trimmed(self, step, threshold):
+        """step's values with its Auto Trim resolved to a start and duration.
+
+        Later steps may depend on the trimmed length, so the silence is
+        detected now rather than when the job starts as in the Trim tab.
+        """
+        clip = self.source(step.get("Select File"))
+        if clip.stage or not is_whole_file(clip):
+            raise ValueError(f"Auto Trim must read source files, not "
+                             f"{step.get('Select File')}")
+        from silence import detect_silence  # NumPy loads on first use
+        silence = detect_silence(clip.file, threshold)
+        print(f"Silence in {clip.file}: {silence.intervals}")
+        return dict(step, **{
+            "Start Time": format_seconds(silence.start),
+            "Duration": format_seconds(silence.end - silence.start),
+            "Auto Trim": "Off"})
+
+    def loop(self, step, output_file):
+        loop_mode = LOOP_MODES[step.get("Loop Mode") or "Auto"]
+        encoding = ENCODING_MODES[step.get("Encoding") or "Single Process"]
+        if loop_mode in ("smart", "copy") or encoding == "chunked":
+            return self.fallback(step, impl.loop_command, ["Select File"],
+                                 output_file)
+        clip = self.source(step.get("Select File"))
+        target = self.duration(step.get("Duration"))
+        if is_whole_file(clip):
+            return clip._replace(loop=True, duration=target, length=None,
+                                 period=self.clip_duration(clip))
+        media = probe_media(clip.file) if not clip.video and not clip.stage else None
+        if media is not None and media.audio_streams:
+            # Repeat the decoded cut; aloop counts its size in samples
+            samples = round(self.clip_duration(clip) *
+                            int(media.audio_streams[0].sample_rate))
+            return clip._replace(length=target, filters=clip.filters + (
+                f"aloop=loop=-1:size={samples}",
+                f"atrim=duration={format_seconds(target)}"))
+        # A cut of a video can only be looped once it is a file of its own
+        clip = self.materialize(clip)
+        return clip._replace(loop=True, duration=target, length=None,
+                             period=clip.length)
+
+    def combine(self, step, output_file):
+        encoding = ENCODING_MODES[step.get("Encoding") or "Single Process"]
+        loudness = LOUDNESS_TARGETS[step.get("Loudness") or "Off"]
+        if encoding == "chunked" or loudness is not None:
+            return self.fallback(step, impl.combine_command,
+                                 ["Select Video File", "Select Audio File"],
+                                 output_file)
+        video = self.source(step.get("Select Video File"))
+        audio = self.source(step.get("Select Audio File"))
+        if video.filters:
+            video = self.materialize(video)
+        audio_args = ["-c:a", AUDIO_CODECS[step.get("Audio Codec") or "AAC"],
+                      "-b:a", BIT_RATES[step.get("Bit Rate") or "384k"],
+                      "-ar", SAMPLING_RATES[step.get("Sampling Rate") or "48 kHz"]]
+        command = ["ffmpeg", "-y", *clip_input_args(video),
+                   *clip_input_args(audio), "-map", "0:v:0"]
+        if audio.filters:
+            command += ["-filter_complex", f"[1:a]{','.join(audio.filters)}[a]",
+                        "-map", "[a]"]
+        else:
+            command += ["-map", "1:a:0"]
+        command += ["-c:v", "copy", *audio_args, "-shortest"]
+        duration = min(self.clip_duration(video), self.clip_duration(audio))
+        if output_file is None:
+            output_file = self.temp_output(video.origin,
+                                           os.path.splitext(video.file)[1])
+        stage = max(video.stage, audio.stage)
+        self.emit(step, stage, command + [output_file], duration, output_file)
+        return Clip(output_file, length=duration, stage=stage + 1, video=True,
+                    origin=video.origin)
+
+    def compile(self):
+        operations = {"trim_audio": self.trim, "loop_video": self.loop,
+                      "combine_audio_video": self.combine}
+        for step in self.steps:
+            operation = operations.get(step.get("operation"))
+            if operation is None:
+                raise ValueError(f"Unknown recipe operation: {step.get('operation')}")
+            output_file = self.output_file(step)
+            clip = operation(step, output_file)
+            if output_file and clip.file != output_file:
+                # Fused so far; write this step's output from its inputs
+                self.emit(step, clip.stage, self.clip_command(clip, output_file),
+                          self.clip_duration(clip), output_file)
+            if step.get("name"):
+                self.results[step["name"]] = clip
+
+        stage, command, seconds, output_file = self.final
+        self.add_command(stage, command, seconds)
+        runs = sum(len(s) for s in self.stages)
+        note = f"{len(self.steps)} steps in {runs} ffmpeg run{'s' if runs > 1 else ''}"
+        return impl.JobSpec(command, output_file, seconds, note,
+                            self.stages if runs > 1 else None, self.temp_paths,
+                            prepare=self.prepare if self.prepares else None)
+
+    def prepare(self, job, on_spawn):
+        for prepare in self.prepares:
+            prepare(job, on_spawn)
+
+def compile_recipe(recipe):
+    """JobSpec for a recipe (see the module docstring)."""
+    return RecipeCompiler(recipe).compile()
@@ -0,0 +1,391 @@
+import asyncio
+import enum
+import functools
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import threading
+import time
+
+import memo
+import telemetry
+from concurrency import ConcurrencyController, system_load, with_threads
+from progress import ProgressParser, with_progress
+
+
+# Sampled by the RateLimitFilter util.get_logger attaches
+progress_logger = logging.getLogger("ffmpeg-win.progress")
+
+class JobState(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+FINISHED_STATES = (JobState.DONE, JobState.FAILED, JobState.CANCELLED)
+
+def remove_paths(paths):
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Error while removing {path}: {e}")
+
+class Job:
+    """An ffmpeg command submitted to a JobScheduler.
+
+    A job may instead run stages: a list of stages, each a list of
+    (command, media_seconds) that run concurrently; stages run in order and
+    progress is reported over all of them. temp_paths are removed once the
+    job finishes, whatever its outcome. A job with a cache_key (see memo)
+    reuses a stored output_file instead of running, and stores its own
+    output_file when it succeeds. describe, if given, turns a Progress into
+    extra text for displays. probe_seconds is how long building the job
+    took, mostly spent probing its inputs (see telemetry). prepare, if
+    given, is called as prepare(job, on_spawn) on a worker thread when the
+    job starts, before its commands run, and may rewrite them with values
+    measured from the inputs; it passes the processes it starts to on_spawn
+    so cancelling the job kills them.
+    """
+    ids = itertools.count(1)
+
+    def __init__(self, command, priority=0, total_duration=None, owner=None,
+                 on_progress=None, note=None, stages=None, temp_paths=None,
+                 output_file=None, cache_key=None, describe=None,
+                 probe_seconds=None, prepare=None):
+        self.id = next(Job.ids)
+        self.command = command
+        self.stages = stages or [[(command, total_duration)]]
+        self.temp_paths = temp_paths or []
+        self.priority = priority  # Lower runs first
+        self.total_duration = total_duration
+        self.owner = owner  # Whoever displays this job, e.g. a Tk page
+        self.on_progress = on_progress
+        self.note = note  # Shown alongside the job's progress
+        self.output_file = output_file
+        self.cache_key = cache_key if output_file else None
+        self.describe = describe
+        self.threads = None  # -threads of its encoders, set when it starts
+        self.disks = None  # Devices a stream copy job reads and writes
+        self.state = JobState.QUEUED
+        self.progress = None
+        self.returncode = None
+        self.time_queued = time.time()
+        self.time_start = None
+        self.time_end = None
+        self.time_first_progress = None
+        self.probe_seconds = probe_seconds
+        self.prepare = prepare
+        self.samples = []  # [seconds, out_time, speed, bitrate]
+        self.reused = False  # Output restored by memo, no ffmpeg ran
+        self.processes = []
+        self.cancel_requested = False
+        self.finished = threading.Event()
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.state.value} {self.command}>"
+
+class JobScheduler:
+    """Runs ffmpeg jobs on an asyncio loop in a background thread.
+
+    Up to max_concurrent jobs run at once, as many as a
+    ConcurrencyController finds raise throughput, and a job runs up to
+    max_concurrent commands of a stage side by side; queued jobs start in
+    priority order, then submission order, unless their disk is busy with
+    other stream copies. submit(), cancel() and wait() are safe to call from
+    any thread. If an events queue is given, every state change
+    and progress update is posted to it as (job, JobState | Progress).
+    """
+    def __init__(self, max_concurrent=None, events=None):
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.controller = ConcurrencyController(self.max_concurrent)
+        self.events = events
+        self.jobs = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.pending = []  # Heap of (priority, sequence, job) not yet started
+        self.wakeup = None
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self.run_loop, args=(ready,),
+                                           name="job-scheduler", daemon=True)
+            self.thread.start()
+            ready.wait()
+
+    def run_loop(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.loop.create_task(self.dispatch())
+        self.loop.call_later(self.controller.interval, self.tune)
+        ready.set()
+        self.loop.run_forever()
+
+    def submit(self, command, priority=0, total_duration=None, owner=None,
+               on_progress=None, note=None, stages=None, temp_paths=None,
+               output_file=None, cache_key=None, describe=None,
+               probe_seconds=None, prepare=None):
+        self.start()
+        job = Job(command, priority, total_duration, owner, on_progress, note,
+                  stages, temp_paths, output_file, cache_key, describe,
+                  probe_seconds, prepare)
+        with self.lock:
+            self.jobs.append(job)
+        self.post(job, job.state)
+        self.loop.call_soon_threadsafe(
+            self.enqueue, (priority, next(self.sequence), job))
+        return job
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.kill, job)
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            self.cancel(job)
+
+    def wait(self, jobs=None, timeout=None):
+        """Block until the given jobs (default: all submitted) finish."""
+        for job in jobs if jobs is not None else list(self.jobs):
+            if not job.finished.wait(timeout):
+                return False
+        return True
+
+    def active_jobs(self):
+        with self.lock:
+            return [job for job in self.jobs if job.state not in FINISHED_STATES]
+
+    def jobs_in_state(self, state):
+        with self.lock:
+            return [job for job in self.jobs if job.state is state]
+
+    def post(self, job, item):
+        if self.events is not None:
+            self.events.put((job, item))
+
+    def set_state(self, job, state):
+        job.state = state
+        if state in FINISHED_STATES and job.time_end is None:
+            job.time_end = time.time()
+        self.post(job, state)
+        if state in FINISHED_STATES:
+            job.finished.set()
+
+    def kill(self, job):
+        if job.state is JobState.QUEUED:
+            # Still pending; dispatch() drops it when it comes up
+            self.set_state(job, JobState.CANCELLED)
+        elif job.state is JobState.RUNNING:
+            self.kill_processes(job)
+
+    def kill_processes(self, job):
+        for process in job.processes:
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    ...
+
+    def enqueue(self, item):
+        heapq.heappush(self.pending, item)
+        self.wakeup.set()
+
+    async def dispatch(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            # A job whose disk is busy doesn't hold up the ones behind it
+            held = []
+            while self.pending and self.controller.has_slot():
+                item = heapq.heappop(self.pending)
+                job = item[2]
+                if job.state is not JobState.QUEUED:
+                    continue
+                if self.controller.can_start(job):
+                    self.controller.started(job, len(self.pending) + len(held))
+                    self.loop.create_task(self.run_admitted(job))
+                else:
+                    held.append(item)
+            for item in held:
+                heapq.heappush(self.pending, item)
+
+    async def run_admitted(self, job):
+        try:
+            await self.run(job)
+        finally:
+            self.controller.finished(job)
+            self.wakeup.set()
+
+    def tune(self):
+        running = self.jobs_in_state(JobState.RUNNING)
+        if running:
+            speeds = [job.progress.speed for job in running
+                      if job.progress is not None and job.progress.speed]
+            queued = any(job.state is JobState.QUEUED
+                         for _, _, job in self.pending)
+            self.controller.adjust(sum(speeds), queued, system_load())
+            self.wakeup.set()
+        self.loop.call_later(self.controller.interval, self.tune)
+
+    def report(self, job, progress):
+        job.progress = progress
+        telemetry.add_sample(job, progress, time.time())
+        if progress.out_time is not None:
+            progress_logger.info("Job %s at %s, speed %sx", job.id,
+                                 progress.out_time, progress.speed,
+                                 extra={"rate_key": job.id})
+        self.post(job, progress)
+        if job.on_progress is not None:
+            job.on_progress(progress)
+
+    async def run(self, job):
+        job.time_start = time.time()
+        self.set_state(job, JobState.RUNNING)
+        try:
+            if await asyncio.to_thread(self.reuse_output, job):
+                job.reused = True
+                job.returncode = 0
+            elif job.prepare is not None and not await asyncio.to_thread(
+                    self.run_prepare, job):
+                ...  # Cancelled while preparing
+            elif len(job.stages) == 1 and len(job.stages[0]) == 1:
+                job.returncode = await self.run_command(
+                    job, with_threads(job.stages[0][0][0], job.threads),
+                    lambda progress: self.report(job, progress))
+            else:
+                job.returncode = await self.run_stages(job)
+            if job.returncode == 0 and job.cache_key:
+                await asyncio.to_thread(memo.store, job.cache_key,
+                                        job.output_file)
+        except Exception as e:
+            print(f"Error while running FFmpeg: {e}")
+        finally:
+            remove_paths(job.temp_paths)
+            if job.cancel_requested:
+                state = JobState.CANCELLED
+            elif job.returncode == 0:
+                state = JobState.DONE
+            else:
+                state = JobState.FAILED
+            # Recorded before waiters on the job are woken
+            job.time_end = time.time()
+            telemetry.record_job(job, state)
+            self.set_state(job, state)
+
+    def run_prepare(self, job):
+        """Run job's prepare hook; False if the job was cancelled meanwhile."""
+        def on_spawn(process):
+            job.processes.append(process)
+            if job.cancel_requested:
+                process.kill()
+
+        job.prepare(job, on_spawn)
+        return not job.cancel_requested
+
+    def reuse_output(self, job):
+        if not job.cache_key:
+            return False
+        exists = os.path.exists(job.output_file)
+        if exists and "-y" not in job.command:
+            return False  # Let ffmpeg refuse to overwrite as it would
+        if memo.restore(job.cache_key, job.output_file):
+            job.note = ", ".join(filter(None, [job.note, "reused earlier output"]))
+            job.progress = None
+            return True
+        if exists and os.stat(job.output_file).st_nlink > 1:
+            # Shares its data with a stored output; don't let ffmpeg write
+            # through the hardlink
+            os.remove(job.output_file)
+        return False
+
+    async def run_stages(self, job):
+        # Progress is the share of all stages' media seconds processed so
+        # far, scaled onto the job's total_duration
+        work_total = sum(seconds or 0 for stage in job.stages
+                         for _, seconds in stage)
+        work_done = 0
+        for stage in job.stages:
+            if job.cancel_requested:
+                return None
+            current = [0.0] * len(stage)
+
+            def on_progress(i, progress):
+                if progress.out_time is not None:
+                    current[i] = min(progress.out_time, stage[i][1] or 0)
+                if work_total and job.total_duration:
+                    share = (work_done + sum(current)) / work_total
+                    progress = progress._replace(
+                        out_time=share * job.total_duration, end=False)
+                self.report(job, progress)
+
+            # At most max_concurrent of a stage's commands run side by side,
+            # sharing the job's threads
+            side_by_side = min(len(stage), self.max_concurrent)
+            threads = job.threads and max(1, job.threads // side_by_side)
+            slots = asyncio.Semaphore(side_by_side)
+            failed = []
+
+            async def run_in_slot(i, command):
+                async with slots:
+                    if failed or job.cancel_requested:
+                        return None  # Not started
+                    returncode = await self.run_command(
+                        job, with_threads(command, threads),
+                        functools.partial(on_progress, i))
+                    if returncode != 0:
+                        failed.append(returncode)
+                    return returncode
+
+            returncodes = await asyncio.gather(*(
+                run_in_slot(i, command)
+                for i, (command, _) in enumerate(stage)))
+            if failed:
+                return failed[0]
+            if None in returncodes:
+                return None
+            work_done += sum(seconds or 0 for _, seconds in stage)
+        return 0
+
+    async def run_command(self, job, command, on_progress):
+        command = with_progress(command)
+        print(command)
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdin=asyncio.subprocess.DEVNULL)
+        job.processes.append(process)
+        if job.cancel_requested:
+            process.kill()
+        stderr_task = asyncio.ensure_future(
+            self.log_diagnostics(process.stderr))
+        parser = ProgressParser()
+        async for line in process.stdout:
+            progress = parser.feed(line.decode(errors="replace"))
+            if progress is not None:
+                on_progress(progress)
+        returncode = await process.wait()
+        await stderr_task
+        if returncode != 0:
+            # One failed command fails the stage; stop its siblings
+            self.kill_processes(job)
+        return returncode
+
+    async def log_diagnostics(self, stream):
+        async for line in stream:
+            line = line.decode(errors="replace").rstrip()
+            if line:
+                print(line)
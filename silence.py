@@ -0,0 +1,104 @@
+"""Silence at the head and tail of a recording, for automatic trims.
+
+Only the ends of a file are decoded: REGION_SECONDS at a time forwards
+from the start until there is sound, then backwards from the end. Each
+region streams through waveform.decode_peaks, whose per-bucket RMS (16 ms
+windows) is compared with the threshold in dBFS. Runs of quiet buckets of
+at least MIN_SILENCE_SECONDS are silence intervals, and the suggested trim
+keeps KEEP_SECONDS of silence either side of the sound.
+"""
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import waveform
+from cache import get_probe_cache
+from probe import probe_media
+
+
+REGION_SECONDS = 120.0
+MIN_SILENCE_SECONDS = 0.5
+KEEP_SECONDS = 0.2
+BUCKET_SECONDS = waveform.BUCKET_SAMPLES / waveform.PEAK_SAMPLE_RATE
+
+# Suggested trim from start to end seconds, and the (start, end) silence
+# intervals found in the decoded regions
+Silence = collections.namedtuple("Silence", ["start", "end", "intervals"])
+
+def loud_buckets(file_path, start, duration, threshold, on_spawn=None):
+    """Start times of the buckets in a region, and whether each is at least
+    threshold dBFS."""
+    peaks = waveform.decode_peaks(file_path, start, duration, on_spawn)
+    if peaks is None:
+        raise ValueError(f"Could not decode {file_path}")
+    level = 20 * np.log10(np.maximum(peaks[:, 2], 1e-10))
+    return start + np.arange(len(peaks)) * BUCKET_SECONDS, level >= threshold
+
+def silent_runs(times, loud):
+    quiet = np.concatenate(([0], (~loud).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(quiet))
+    return [(float(times[first]), float(times[last - 1] + BUCKET_SECONDS))
+            for first, last in zip(edges[::2], edges[1::2])]
+
+def merge_runs(runs):
+    """Runs joined where regions split them, without the short ones."""
+    merged = []
+    for start, end in sorted(runs):
+        if merged and start - merged[-1][1] < BUCKET_SECONDS / 2:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return [(start, end) for start, end in merged
+            if end - start >= MIN_SILENCE_SECONDS]
+
+def detect_silence(file_path, threshold=-50.0, on_spawn=None):
+    """Silence of file_path quieter than threshold dBFS; cached per file
+    and threshold. on_spawn gets each decoding ffmpeg's Popen."""
+    if np is None:
+        raise ValueError("Silence detection needs NumPy, which is not installed")
+    cache = get_probe_cache("silence")
+    found = cache.get(file_path) or {}
+    key = f"{threshold:g}"
+    if key in found:
+        start, end, intervals = found[key]
+        return Silence(start, end, [tuple(i) for i in intervals])
+    media = probe_media(file_path)
+    if media is None or media.duration is None:
+        raise ValueError(f"Could not read duration of {file_path}")
+    duration = media.duration
+
+    runs = []
+    sound_start = sound_end = None
+    head_end = 0.0
+    while sound_start is None and head_end < duration:
+        times, loud = loud_buckets(file_path, head_end, REGION_SECONDS,
+                                   threshold, on_spawn)
+        runs += silent_runs(times, loud)
+        head_end += REGION_SECONDS
+        if loud.any():
+            sound_start = times[loud.argmax()]
+            # The tail may lie in this region already
+            sound_end = times[len(loud) - 1 - loud[::-1].argmax()] + BUCKET_SECONDS
+    if sound_start is None:
+        raise ValueError(f"{file_path} is silent below {threshold:g} dB")
+    tail_start = duration
+    while tail_start > head_end:
+        region_start = max(tail_start - REGION_SECONDS, head_end)
+        times, loud = loud_buckets(file_path, region_start,
+                                   tail_start - region_start, threshold,
+                                   on_spawn)
+        runs += silent_runs(times, loud)
+        tail_start = region_start
+        if loud.any():
+            sound_end = times[len(loud) - 1 - loud[::-1].argmax()] + BUCKET_SECONDS
+            break
+
+    silence = Silence(float(max(sound_start - KEEP_SECONDS, 0.0)),
+                      float(min(sound_end + KEEP_SECONDS, duration)),
+                      merge_runs(runs))
+    found[key] = list(silence)
+    cache.put(file_path, found)
+    return silence
@@ -0,0 +1,216 @@
+"""Frame-accurate cuts at close to stream copy speed.
+
+Only the partial GOPs at the edges of a range are re-encoded, with
+encoder settings matched to the source stream; the keyframe-aligned middle
+is stream copied. Video pieces go through MPEG-TS intermediates, which
+carry parameter sets in-band so re-encoded and copied pieces concatenate
+cleanly, and audio is stream copied from the source in the final mux.
+"""
+import os
+
+from concat import work_dir_for, write_concat_list, write_doubling_lists
+from keyframes import keyframe_after, keyframe_before
+from probe import probe_media
+from util import format_seconds
+
+
+# Source codec -> encoder used to re-render boundary GOPs
+SMART_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "mpeg2video": "mpeg2video",
+}
+
+# ffprobe's profile names -> the encoder's -profile:v; other profiles (intra
+# only, range extensions) are left for the encoder to pick from -pix_fmt
+ENCODER_PROFILES = {
+    "h264": {
+        "Baseline": "baseline",
+        "Constrained Baseline": "baseline",
+        "Main": "main",
+        "High": "high",
+        "High 10": "high10",
+        "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444",
+    },
+    "hevc": {
+        "Main": "main",
+        "Main 10": "main10",
+        "Main Still Picture": "mainstillpicture",
+    },
+}
+
+def can_smart_cut(media):
+    return bool(media.video_streams) and (
+        media.video_streams[0].codec_name in SMART_ENCODERS)
+
+def encoder_args(stream):
+    """Encoder options reproducing the source stream's parameters."""
+    args = ["-c:v", SMART_ENCODERS[stream.codec_name]]
+    if stream.pix_fmt:
+        args += ["-pix_fmt", stream.pix_fmt]
+    if stream.r_frame_rate and stream.r_frame_rate != "0/0":
+        args += ["-r", stream.r_frame_rate]
+    profile = ENCODER_PROFILES.get(stream.codec_name, {}).get(stream.profile)
+    if profile:
+        args += ["-profile:v", profile]
+    if stream.bit_rate:
+        args += ["-b:v", str(stream.bit_rate)]
+    elif stream.codec_name in ("h264", "hevc"):
+        args += ["-crf", "18"]
+    return args
+
+def encode_piece(file_path, stream, start, duration, piece_path):
+    return [
+        "ffmpeg", "-y",
+        "-ss", format_seconds(start),
+        "-i", file_path,
+        "-t", format_seconds(duration),
+        "-map", "0:v:0",
+        *encoder_args(stream),
+        "-f", "mpegts", piece_path
+    ]
+
+def copy_piece(input_args, duration, piece_path):
+    return [
+        "ffmpeg", "-y",
+        *input_args,
+        "-t", format_seconds(duration),
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-f", "mpegts", piece_path
+    ]
+
+def join_command(pieces_list, audio_input_args, duration_arg, output_file,
+                 overwrite):
+    return [
+        "ffmpeg", "-y" if overwrite else "-n",
+        "-f", "concat", "-safe", "0", "-i", pieces_list,
+        *audio_input_args,
+        "-t", duration_arg,
+        "-map", "0:v:0", "-map", "1:a?",
+        "-c", "copy",
+        output_file
+    ]
+
+def smart_cut_stages(pieces, work_dir, audio_input_args, duration, output_file,
+                     overwrite):
+    """Stages for a JobSpec: render every piece concurrently, then join."""
+    pieces_list = write_concat_list(os.path.join(work_dir, "pieces.ffconcat"),
+                                    [path for path, _, _ in pieces])
+    join = join_command(pieces_list, audio_input_args, format_seconds(duration),
+                        output_file, overwrite)
+    stages = [[(command, seconds) for _, command, seconds in pieces],
+              [(join, duration)]]
+    return join, stages
+
+def smart_cut_stream(file_path):
+    media = probe_media(file_path)
+    if media is None or not can_smart_cut(media):
+        raise ValueError(f"{file_path} can't be smart rendered")
+    return media.video_streams[0]
+
+def trim_pieces(file_path, stream, start, duration, work_dir):
+    """(path, command, seconds) of the pieces of a frame-accurate trim."""
+    end = start + duration
+    # Looked up in windows around the cut points, not a scan of the file
+    head_end = keyframe_after(file_path, start)
+    tail_start = keyframe_before(file_path, end)
+
+    pieces = []
+    if head_end is None or head_end >= tail_start:
+        # No whole GOP inside the range, render all of it
+        path = os.path.join(work_dir, "all.ts")
+        pieces.append((path, encode_piece(file_path, stream, start, duration,
+                                          path), duration))
+    else:
+        if head_end > start:
+            path = os.path.join(work_dir, "head.ts")
+            pieces.append((path, encode_piece(
+                file_path, stream, start, head_end - start, path),
+                head_end - start))
+        path = os.path.join(work_dir, "middle.ts")
+        pieces.append((path, copy_piece(
+            ["-ss", format_seconds(head_end), "-i", file_path],
+            tail_start - head_end, path), tail_start - head_end))
+        if end > tail_start:
+            path = os.path.join(work_dir, "tail.ts")
+            pieces.append((path, encode_piece(
+                file_path, stream, tail_start, end - tail_start, path),
+                end - tail_start))
+    return pieces
+
+def smart_trim(file_path, start, duration, output_file):
+    """(command, stages, temp_paths) for a frame-accurate trim."""
+    stream = smart_cut_stream(file_path)
+    work_dir = work_dir_for(output_file)
+    pieces = trim_pieces(file_path, stream, start, duration, work_dir)
+    audio_input_args = ["-ss", format_seconds(start), "-i", file_path]
+    command, stages = smart_cut_stages(pieces, work_dir, audio_input_args,
+                                       duration, output_file, overwrite=False)
+    return command, stages, [work_dir]
+
+def pending_smart_trim(file_path, start_arg, duration_arg, output_file):
+    """(command, stages, temp_paths, render) for a frame-accurate trim whose
+    range is only known when the job starts.
+
+    The join reads start_arg and duration_arg, placeholders the job fills
+    in, and stages holds no pieces yet: render(start, duration) lists them
+    for the join and returns their stage.
+    """
+    stream = smart_cut_stream(file_path)
+    work_dir = work_dir_for(output_file)
+    pieces_list = os.path.join(work_dir, "pieces.ffconcat")
+    command = join_command(pieces_list, ["-ss", start_arg, "-i", file_path],
+                           duration_arg, output_file, overwrite=False)
+
+    def render(start, duration):
+        pieces = trim_pieces(file_path, stream, start, duration, work_dir)
+        write_concat_list(pieces_list, [path for path, _, _ in pieces])
+        return [(command, seconds) for _, command, seconds in pieces]
+
+    return command, [[], [(command, None)]], [work_dir], render
+
+def smart_loop(file_path, source_duration, target_duration, output_file):
+    """(command, stages, temp_paths) for a loop with a frame-accurate tail.
+
+    Whole plays of the source and its tail up to the last keyframe are
+    stream copied through concat scripts; only the GOP the loop ends in is
+    re-encoded.
+    """
+    stream = smart_cut_stream(file_path)
+    full_loops = int(target_duration // source_duration)
+    tail = target_duration - full_loops * source_duration
+    tail_copy = keyframe_before(file_path, tail) if tail > 0 else 0.0
+    work_dir = work_dir_for(output_file)
+
+    entries = []
+    if full_loops:
+        entries.append({"file": write_doubling_lists(file_path, full_loops,
+                                                     work_dir),
+                        "options": {"safe": "0"}})
+    if tail_copy > 0:
+        entries.append({"file": os.path.abspath(file_path),
+                        "outpoint": format_seconds(tail_copy)})
+    pieces = []
+    copy_seconds = full_loops * source_duration + tail_copy
+    if entries:
+        copy_list = write_concat_list(
+            os.path.join(work_dir, "copy.ffconcat"), entries)
+        path = os.path.join(work_dir, "copy.ts")
+        pieces.append((path, copy_piece(
+            ["-f", "concat", "-safe", "0", "-i", copy_list],
+            copy_seconds, path), copy_seconds))
+    if tail > tail_copy:
+        path = os.path.join(work_dir, "tail.ts")
+        pieces.append((path, encode_piece(
+            file_path, stream, tail_copy, tail - tail_copy, path),
+            tail - tail_copy))
+
+    loops = full_loops + (1 if tail > 0 else 0)
+    audio_input_args = ["-f", "concat", "-safe", "0",
+                        "-i", write_doubling_lists(file_path, loops, work_dir)]
+    command, stages = smart_cut_stages(pieces, work_dir, audio_input_args,
+                                       target_duration, output_file,
+                                       overwrite=True)
+    return command, stages, [work_dir]
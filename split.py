@@ -0,0 +1,155 @@
+"""Cut many ranges out of one file in a single ffmpeg run.
+
+Ranges come from a cue sheet, a CSV or the file's own chapters. The input
+is opened once and every range goes to its own output of the same ffmpeg
+command, stream copied. -copyts keeps the outputs' timestamps on the input
+timeline until the muxer rebases them, so the command's progress is a
+position in the input and tells how far each output has got.
+"""
+import collections
+import csv
+import os
+import re
+import shlex
+
+from util import *
+
+
+Range = collections.namedtuple("Range", ["start", "end", "title"])
+
+CUE_FRAMES_PER_SECOND = 75
+
+def cue_time(value):
+    """Seconds of a cue sheet MM:SS:FF index."""
+    minutes, seconds, frames = (int(part) for part in value.split(":"))
+    return minutes * 60 + seconds + frames / CUE_FRAMES_PER_SECOND
+
+def read_cue_sheet(path):
+    """Ranges of a cue sheet's tracks; each ends where the next starts."""
+    ranges = []
+    title = None
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            try:
+                fields = shlex.split(line)
+            except ValueError:
+                fields = line.split()
+            if not fields:
+                continue
+            keyword = fields[0].upper()
+            if keyword == "TRACK":
+                title = None
+            elif keyword == "TITLE" and len(fields) > 1:
+                title = fields[1]
+            elif keyword == "INDEX" and fields[1:2] == ["01"]:
+                ranges.append(Range(cue_time(fields[2]), None, title))
+    return ranges
+
+def read_ranges_csv(path):
+    """Ranges of a CSV with start, end and title columns.
+
+    A header row may name the columns (start, end, duration, title) in any
+    order; without one the columns are start, end, title. Times are
+    HH:MM:SS(.sss) or seconds, and an empty end runs to the next start.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    columns = ["start", "end", "title"]
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "start" in header:
+        columns = header
+        rows = rows[1:]
+    ranges = []
+    for row in rows:
+        values = dict(zip(columns, (cell.strip() for cell in row)))
+        start = duration_to_seconds(values.get("start") or "")
+        if start is None:
+            raise ValueError(f"Invalid start time in {path}: {row}")
+        end = None
+        if values.get("end"):
+            end = duration_to_seconds(values["end"])
+        elif values.get("duration"):
+            end = start + duration_to_seconds(values["duration"])
+        ranges.append(Range(start, end, values.get("title") or None))
+    return ranges
+
+def chapter_ranges(media):
+    return [Range(c.start_time, c.end_time, c.title) for c in media.chapters]
+
+def read_ranges(path):
+    if os.path.splitext(path)[1].lower() == ".cue":
+        return read_cue_sheet(path)
+    return read_ranges_csv(path)
+
+def complete_ranges(ranges, duration):
+    """Sorted ranges with open ends closed at the next start or duration,
+    empty ones dropped."""
+    ranges = sorted(ranges, key=lambda r: r.start)
+    complete = []
+    for i, r in enumerate(ranges):
+        end = r.end
+        if end is None:
+            end = ranges[i + 1].start if i + 1 < len(ranges) else duration
+        if duration is not None:
+            end = min(end, duration)
+        if end is not None and end > r.start:
+            complete.append(r._replace(end=end))
+    return complete
+
+def safe_name(title):
+    return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", title).strip(" .")
+
+def output_names(file_path, ranges, prefix=None):
+    directory, filename = os.path.split(file_path)
+    stem, ext = os.path.splitext(filename)
+    prefix = prefix or stem
+    width = max(2, len(str(len(ranges))))
+    names = []
+    for i, r in enumerate(ranges, 1):
+        name = f"{prefix}_{i:0{width}}"
+        if r.title:
+            name = f"{name} {safe_name(r.title)}"
+        names.append(os.path.join(directory, name + ext))
+    return names
+
+def split_command(file_path, ranges, outputs, start_time=0.0):
+    """One ffmpeg command writing every range to its output.
+
+    start_time is the input's first timestamp, which -copyts keeps.
+    """
+    command = ["ffmpeg", "-copyts", "-i", file_path]
+    for i, (r, output_file) in enumerate(zip(ranges, outputs), 1):
+        command += [
+            "-map", "0",
+            "-ss", format_seconds(start_time + r.start),
+            "-to", format_seconds(start_time + r.end),
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-metadata", f"track={i}/{len(ranges)}",
+        ]
+        if r.title:
+            command += ["-metadata", f"title={r.title}"]
+        command.append(output_file)
+    return command
+
+def output_progress(ranges, position):
+    """Fraction done of each output at position on the input timeline."""
+    return [min(max((position - r.start) / (r.end - r.start), 0.0), 1.0)
+            for r in ranges]
+
+def describe_split(ranges, start_time=0.0):
+    """Progress text for a split job: outputs finished and the current one."""
+    def describe(progress):
+        if progress.out_time is None:
+            return None
+        fractions = output_progress(ranges, progress.out_time - start_time)
+        done = sum(1 for f in fractions if f >= 1)
+        current = [(i, f) for i, f in enumerate(fractions) if 0 < f < 1]
+        text = f"{done}/{len(ranges)} outputs done"
+        if current:
+            i, fraction = current[0]
+            text += f", #{i + 1} {ranges[i].title or ''} {fraction:.0%}".replace("  ", " ")
+        return text
+    return describe
@@ -0,0 +1,165 @@
+"""Performance records of finished jobs.
+
+Every job that ran appends one JSON line to TELEMETRY_FILE with its wall
+time, time spent queued and probing, time to first progress, output size,
+and (seconds, media position, speed, bitrate) samples taken at most every
+SAMPLE_SECONDS.
+
+If the FFMPEG_WIN_TEXTFILE_DIR environment variable names the directory of
+node_exporter's textfile collector, ffmpeg_win.prom there is rewritten
+after each job with this process's running totals, from which Prometheus
+can chart throughput as rate(ffmpeg_win_media_seconds_total[5m]). Jobs
+that reused a stored output (see memo) count towards
+ffmpeg_win_reused_media_seconds_total instead.
+
+CPU time and peak RSS are only reported for the process as a whole, from
+getrusage(RUSAGE_CHILDREN): jobs run side by side, and the asyncio
+subprocesses they run are reaped without their own resource usage. They
+are missing on Windows.
+"""
+import json
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+from cache import atomic_write
+from util import LOG_DIR
+
+
+TELEMETRY_FILE = os.path.join(LOG_DIR, "jobs.jsonl")
+TEXTFILE_DIR_VARIABLE = "FFMPEG_WIN_TEXTFILE_DIR"
+TEXTFILE_NAME = "ffmpeg_win.prom"
+SAMPLE_SECONDS = 1.0
+
+# ru_maxrss is in kilobytes, except on macOS
+MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+lock = threading.Lock()
+totals = {"jobs": {}, "media_seconds": 0.0, "reused_media_seconds": 0.0,
+          "wall_seconds": 0.0, "output_bytes": 0}
+last = {}
+
+def children_usage():
+    """(CPU seconds, peak RSS bytes) of this process's finished children,
+    e.g. every ffmpeg and ffprobe run so far; (None, None) on Windows."""
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (round(usage.ru_utime + usage.ru_stime, 3),
+            usage.ru_maxrss * MAXRSS_BYTES)
+
+def add_sample(job, progress, now):
+    """Keep progress in job's samples, at most one per SAMPLE_SECONDS."""
+    if progress.out_time is None:
+        return
+    if job.time_first_progress is None:
+        job.time_first_progress = now
+    if (progress.end or not job.samples or
+            now - job.time_start - job.samples[-1][0] >= SAMPLE_SECONDS):
+        job.samples.append([round(now - job.time_start, 3),
+                            round(progress.out_time, 3), progress.speed,
+                            progress.bitrate])
+
+def since_start(job, t):
+    return round(t - job.time_start, 3) if t and job.time_start else None
+
+def job_record(job, state):
+    """The JSON line of a finished job."""
+    output_bytes = None
+    if job.output_file and os.path.isfile(job.output_file):
+        output_bytes = os.path.getsize(job.output_file)
+    record = {
+        "job": job.id,
+        "time": round(job.time_end, 3),
+        "state": state.value,
+        "returncode": job.returncode,
+        "command": job.command,
+        "output_file": job.output_file,
+        "output_bytes": output_bytes,
+        "media_seconds": job.total_duration,
+        "queued_seconds": (round(job.time_start - job.time_queued, 3)
+                           if job.time_start else None),
+        "probe_seconds": (round(job.probe_seconds, 3)
+                          if job.probe_seconds is not None else None),
+        "wall_seconds": since_start(job, job.time_end),
+        "first_progress_seconds": since_start(job, job.time_first_progress),
+        "threads": job.threads,
+        "processes": len(job.processes),
+        "reused": job.reused,
+        "samples": job.samples,
+    }
+    if job.note:
+        record["note"] = job.note
+    return record
+
+def prometheus_text():
+    cpu_seconds, peak_rss_bytes = children_usage()
+    lines = ["# HELP ffmpeg_win_jobs_total Jobs finished, by state.",
+             "# TYPE ffmpeg_win_jobs_total counter"]
+    for state, count in sorted(totals["jobs"].items()):
+        lines.append(f'ffmpeg_win_jobs_total{{state="{state}"}} {count}')
+    for name, kind, help_text, value in (
+            ("media_seconds_total", "counter",
+             "Media seconds of done jobs that ran ffmpeg.",
+             totals["media_seconds"]),
+            ("reused_media_seconds_total", "counter",
+             "Media seconds of done jobs that reused a stored output.",
+             totals["reused_media_seconds"]),
+            ("wall_seconds_total", "counter", "Wall time of finished jobs.",
+             totals["wall_seconds"]),
+            ("cpu_seconds_total", "counter",
+             "CPU time of finished ffmpeg and ffprobe processes.",
+             cpu_seconds),
+            ("output_bytes_total", "counter",
+             "Bytes written by done jobs that ran ffmpeg.",
+             totals["output_bytes"]),
+            ("last_speed", "gauge",
+             "Media seconds per second of the last done job that ran ffmpeg.",
+             last.get("speed")),
+            ("last_first_progress_seconds", "gauge",
+             "Time to first progress of the last done job that ran ffmpeg.",
+             last.get("first_progress_seconds")),
+            ("child_peak_rss_bytes", "gauge",
+             "Peak RSS of the largest finished ffmpeg or ffprobe process.",
+             peak_rss_bytes)):
+        if value is None:
+            continue
+        lines += [f"# HELP ffmpeg_win_{name} {help_text}",
+                  f"# TYPE ffmpeg_win_{name} {kind}",
+                  f"ffmpeg_win_{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+def write_textfile(directory):
+    # Written aside and renamed, so the collector never reads half a file
+    text = prometheus_text().encode("utf-8")
+    atomic_write(os.path.join(directory, TEXTFILE_NAME), lambda f: f.write(text))
+
+def record_job(job, state):
+    """Append job's record and update the Prometheus totals."""
+    try:
+        record = job_record(job, state)
+        with lock:
+            os.makedirs(os.path.dirname(TELEMETRY_FILE), exist_ok=True)
+            with open(TELEMETRY_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            totals["jobs"][state.value] = totals["jobs"].get(state.value, 0) + 1
+            totals["wall_seconds"] += record["wall_seconds"] or 0
+            if state.value == "done" and job.reused:
+                totals["reused_media_seconds"] += record["media_seconds"] or 0
+            elif state.value == "done":
+                totals["media_seconds"] += record["media_seconds"] or 0
+                totals["output_bytes"] += record["output_bytes"] or 0
+                if record["media_seconds"] and record["wall_seconds"]:
+                    last["speed"] = round(record["media_seconds"] /
+                                          record["wall_seconds"], 3)
+                last["first_progress_seconds"] = record["first_progress_seconds"]
+            directory = os.environ.get(TEXTFILE_DIR_VARIABLE)
+            if directory:
+                write_textfile(directory)
+    except Exception as e:
+        print(f"Error while recording telemetry of job {job.id}: {e}")
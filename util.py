@@ -1,8 +1,10 @@
+import atexit
 import time
 import logging
 import logging.handlers
 import os
-import inspect
+import queue
+import sys
 
 
 # Define log file settings
@@ -20,11 +22,11 @@ def duration_to_seconds(duration):
 
         # Calculate the total number of seconds
         total_seconds = hours * 3600 + minutes * 60 + seconds
-        return int(total_seconds)
+        return total_seconds
     except ValueError:
         ...
     try:
-        return int(duration)
+        return float(duration)
     except ValueError:
         print("Invalid format. Please use HH:MM:SS, HH:MM:SS.sss, or seconds")
         return None
@@ -36,20 +38,74 @@ def convert_seconds_to_hhmmss(duration):
     seconds = int(duration % 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
+def format_seconds(duration):
+    """Seconds as a plain decimal string for ffmpeg arguments."""
+    return f"{duration:.6f}".rstrip("0").rstrip(".")
+
+def format_timestamp(duration):
+    """Convert a duration in seconds to HH:MM:SS.mmm format."""
+    milliseconds = int(round(duration * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02}.{milliseconds:03}"
+
 def convert_epoch_to_hhmmss(epoch_time):
     """Convert epoch time (absolute seconds) to HH:MM:SS format."""
     local_time = time.localtime(epoch_time)  # Convert epoch to local time
     return time.strftime("%H:%M:%S", local_time)
 
-# Ensure log directory exists
-os.makedirs(LOG_DIR, exist_ok=True)
 log_path = os.path.join(LOG_DIR, LOG_FILE)
 
+PROGRESS_LOG_INTERVAL = 10  # Seconds between logged progress lines per job
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for the listener thread without formatting them."""
+    def prepare(self, record):
+        # Merge args now so later changes to them can't alter the message,
+        # but leave timestamps, caller info and tracebacks to the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class RateLimitFilter(logging.Filter):
+    """Lets one record per rate_key (or message) through every interval.
+
+    Keys whose interval has passed are forgotten once more than max_keys
+    are held, so finished jobs don't pile up in long runs.
+    """
+    def __init__(self, interval, max_keys=256):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.last_emitted = {}
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", record.msg)
+        now = record.created
+        if now - self.last_emitted.get(key, 0) < self.interval:
+            return False
+        self.last_emitted[key] = now
+        if len(self.last_emitted) > self.max_keys:
+            self.last_emitted = {k: t for k, t in self.last_emitted.items()
+                                 if now - t < self.interval}
+        return True
+
+log_listener = None
+
 # Create a logger
 def get_logger(name):
-    """Returns a logger configured for both console and rotating file logging."""
+    """Returns a logger configured for both console and rotating file logging.
+
+    Records are handed to a queue and written by a background
+    QueueListener, so logging never blocks on console or disk I/O.
+    """
+    global log_listener
     logger = logging.getLogger(name)
+    if any(isinstance(h, DeferredQueueHandler) for h in logger.handlers):
+        return logger  # Already configured by another module
     logger.setLevel(logging.INFO)
+    os.makedirs(LOG_DIR, exist_ok=True)
 
     # Create a formatter that includes timestamp, filename, and line number
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
@@ -57,12 +113,21 @@ def get_logger(name):
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # File handler with rotation
     file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=5*1024*1024, backupCount=3)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # Flush what's queued on exit
+
+    # Progress goes through a child logger sampled per job
+    logging.getLogger(f"{name}.progress").addFilter(
+        RateLimitFilter(PROGRESS_LOG_INTERVAL))
 
     return logger
 
@@ -73,12 +138,22 @@ class LoggerWriter:
         self.level = level
 
     def write(self, message):
-        if message.strip():  # Ignore empty lines
-            frame = inspect.currentframe().f_back  # Get previous stack frame
-            caller_filename = frame.f_code.co_filename
-            caller_lineno = frame.f_lineno
-            self.logger.log(self.level, (f"{caller_filename}:{caller_lineno}"
-                            f" - {message.strip()}"))
+        if not message.strip() or not self.logger.isEnabledFor(self.level):
+            return
+        # The caller of print() is one frame up; look it up only for
+        # records that will be emitted, and skip logging's own stack walk
+        frame = sys._getframe(1)
+        record = self.logger.makeRecord(
+            self.logger.name, self.level, frame.f_code.co_filename,
+            frame.f_lineno, message.strip(), None, None)
+        self.logger.handle(record)
 
     def flush(self):
-        pass  # Required for compatibility with sys.stdout
\ No newline at end of file
+        pass  # Required for compatibility with sys.stdout
+
+def redirect_stdout(name):
+    """Send print() output to the named logger; entry points call this once."""
+    logger = get_logger(name)
+    if not isinstance(sys.stdout, LoggerWriter):
+        sys.stdout = LoggerWriter(logger)
+    return logger
@@ -0,0 +1,204 @@
+"""Waveform peaks of a file's audio, kept as a multi-resolution pyramid.
+
+ffmpeg decodes the audio to mono float PCM on stdout, which is read in
+fixed-size blocks and reduced to min, max and RMS per bucket of
+BUCKET_SAMPLES samples. Each coarser level merges LEVEL_FACTOR buckets of
+the one below, down to at most COARSEST_BUCKETS buckets. The pyramid is
+written once per file (path, size, mtime) to a sidecar in WAVEFORM_DIR and
+memory-mapped on use, so drawing any span at any zoom reads only the
+buckets of one level that cover it.
+
+Needs NumPy; load_peaks() returns None without it.
+"""
+import hashlib
+import os
+import struct
+import subprocess
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from cache import CACHE_DIR, atomic_write, evict_entries, file_entries
+from util import format_seconds
+
+
+WAVEFORM_DIR = os.path.join(CACHE_DIR, "waveforms")
+WAVEFORM_MAX_BYTES = 2 * 1024 ** 3
+PEAK_SAMPLE_RATE = 16000
+BUCKET_SAMPLES = 256  # 16 ms per bucket at the finest level
+LEVEL_FACTOR = 2
+COARSEST_BUCKETS = 1024
+BLOCK_BUCKETS = 4096  # Buckets per read from ffmpeg (4 MiB of samples)
+
+# Sidecar layout: header, one uint64 bucket count per level, then each
+# level's float32 (min, max, rms) rows, finest first
+MAGIC = b"PEAKS001"
+HEADER = struct.Struct("<8sIIII")  # magic, sample rate, bucket, factor, levels
+
+def peaks_path(file_path):
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(WAVEFORM_DIR, f"{digest}.peaks")
+
+def decode_command(file_path, start=None, duration=None):
+    command = ["ffmpeg", "-v", "error", "-nostdin"]
+    if start:
+        command += ["-ss", format_seconds(start)]
+    if duration is not None:
+        command += ["-t", format_seconds(duration)]
+    return command + ["-i", file_path, "-vn", "-ac", "1",
+                      "-ar", str(PEAK_SAMPLE_RATE), "-f", "f32le", "-"]
+
+def bucket_peaks(samples):
+    """(min, max, rms) rows of each BUCKET_SAMPLES samples; a shorter last
+    bucket is reduced on its own."""
+    full = len(samples) // BUCKET_SAMPLES * BUCKET_SAMPLES
+    parts = [samples[:full].reshape(-1, BUCKET_SAMPLES)]
+    if full < len(samples):
+        parts.append(samples[full:].reshape(1, -1))
+    rows = []
+    for buckets in parts:
+        peaks = np.empty((len(buckets), 3), dtype=np.float32)
+        buckets.min(axis=1, out=peaks[:, 0])
+        buckets.max(axis=1, out=peaks[:, 1])
+        peaks[:, 2] = np.sqrt(np.einsum("ij,ij->i", buckets, buckets) /
+                              buckets.shape[1])
+        rows.append(peaks)
+    return np.concatenate(rows)
+
+def merge_peaks(peaks, starts):
+    """Rows merging peaks[starts[i]:starts[i + 1]]; a start not above the
+    previous one yields that single row."""
+    counts = np.maximum(np.diff(np.append(starts, len(peaks))), 1)
+    merged = np.empty((len(starts), 3), dtype=np.float32)
+    merged[:, 0] = np.minimum.reduceat(peaks[:, 0], starts)
+    merged[:, 1] = np.maximum.reduceat(peaks[:, 1], starts)
+    merged[:, 2] = np.sqrt(np.add.reduceat(
+        np.square(peaks[:, 2], dtype=np.float64), starts) / counts)
+    return merged
+
+def decode_peaks(file_path, start=None, duration=None, on_spawn=None):
+    """Finest level peaks of file_path's audio, optionally of duration
+    seconds from start; None if ffmpeg fails or is killed."""
+    process = subprocess.Popen(decode_command(file_path, start, duration),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               stdin=subprocess.DEVNULL)
+    if on_spawn:
+        on_spawn(process)
+    # Drained alongside stdout, so a full stderr pipe can't stall ffmpeg
+    errors = []
+    drain = threading.Thread(target=lambda: errors.append(process.stderr.read()),
+                             daemon=True)
+    drain.start()
+    block = np.empty(BLOCK_BUCKETS * BUCKET_SAMPLES, dtype=np.float32)
+    view = memoryview(block).cast("B")
+    rows = []
+    with process:
+        while True:
+            filled = 0
+            while filled < len(view):
+                count = process.stdout.readinto(view[filled:])
+                if not count:
+                    break
+                filled += count
+            samples = filled // block.itemsize
+            if samples:
+                rows.append(bucket_peaks(block[:samples]))
+            if filled < len(view):
+                break
+        drain.join()
+    errors = b"".join(errors).decode("utf-8", errors="replace")
+    if process.returncode != 0 or not rows:
+        print(f"Error while decoding {file_path} for peaks: "
+              f"{errors.strip() or f'exit code {process.returncode}'}")
+        return None
+    return np.concatenate(rows)
+
+def write_pyramid(path, finest):
+    levels = [finest]
+    while len(levels[-1]) > COARSEST_BUCKETS:
+        level = levels[-1]
+        levels.append(merge_peaks(level, np.arange(0, len(level), LEVEL_FACTOR)))
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, PEAK_SAMPLE_RATE, BUCKET_SAMPLES,
+                            LEVEL_FACTOR, len(levels)))
+        f.write(struct.pack(f"<{len(levels)}Q", *(len(l) for l in levels)))
+        for level in levels:
+            f.write(level.astype("<f4").tobytes())
+
+    atomic_write(path, write)
+
+class Peaks:
+    """Memory-mapped peak pyramid of one file."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, self.sample_rate, self.bucket, self.factor, count = (
+                HEADER.unpack(f.read(HEADER.size)))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a peaks file")
+            lengths = struct.unpack(f"<{count}Q", f.read(8 * count))
+        data = np.memmap(path, dtype="<f4", mode="r",
+                         offset=HEADER.size + 8 * count)
+        self.levels = []
+        offset = 0
+        for length in lengths:
+            self.levels.append(data[offset:offset + 3 * length].reshape(-1, 3))
+            offset += 3 * length
+
+    def bucket_seconds(self, level):
+        return self.bucket * self.factor ** level / self.sample_rate
+
+    @property
+    def duration(self):
+        return len(self.levels[0]) * self.bucket_seconds(0)
+
+    def columns(self, start, end, width):
+        """(min, max, rms) rows of width equal columns from start to end
+        seconds, read from the coarsest level with a bucket per column."""
+        level = 0
+        while (level + 1 < len(self.levels) and
+               (end - start) / self.bucket_seconds(level + 1) >= width):
+            level += 1
+        peaks = self.levels[level]
+        edges = np.linspace(start, end, width + 1) / self.bucket_seconds(level)
+        first = max(int(edges[0]), 0)
+        last = min(int(np.ceil(edges[-1])), len(peaks))
+        columns = np.zeros((width, 3), dtype=np.float32)
+        inside = (edges[1:] > 0) & (edges[:-1] < len(peaks))
+        if first >= last or not inside.any():
+            return columns
+        span = np.asarray(peaks[first:last])  # Only these pages are read
+        starts = np.clip(edges[:-1].astype(np.int64) - first, 0, len(span) - 1)
+        columns[inside] = merge_peaks(span, starts[inside])
+        return columns
+
+def load_peaks(file_path, on_spawn=None):
+    """Peaks of file_path's audio, decoded only the first time; None if it
+    has none or NumPy isn't installed."""
+    if np is None:
+        print("Waveforms need NumPy, which is not installed")
+        return None
+    try:
+        path = peaks_path(file_path)
+        if os.path.exists(path):
+            os.utime(path)  # Marks it recently used
+        else:
+            finest = decode_peaks(file_path, on_spawn=on_spawn)
+            if finest is None:
+                return None
+            os.makedirs(WAVEFORM_DIR, exist_ok=True)
+            write_pyramid(path, finest)
+            evict_peaks()
+        return Peaks(path)
+    except (OSError, ValueError) as e:
+        print(f"Error while loading peaks of {file_path}: {e}")
+        return None
+
+def evict_peaks(max_bytes=WAVEFORM_MAX_BYTES):
+    """Drop least recently used sidecars beyond max_bytes."""
+    evict_entries(file_entries(WAVEFORM_DIR, ".peaks"), max_bytes)